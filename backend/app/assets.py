@@ -0,0 +1,99 @@
+"""Card images: the variant manifests and the /cards static mount.
+
+scripts/compress_cards.py writes a card_manifest.json next to each game's
+compressed images, mapping image_path (relative to CARDS_PATH) to its
+resized WebP/AVIF copies. The catalog attaches them to CardOut.variants.
+
+Variant file names carry a hash of their content, so /cards serves them as
+immutable; other files get a short max-age and are revalidated by ETag.
+"""
+import logging
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Tuple
+from urllib.parse import quote
+
+import orjson
+from fastapi.staticfiles import StaticFiles
+from pydantic import ValidationError
+from starlette.responses import FileResponse, Response
+
+from .schemas import CardImageOut, CardVariantOut
+
+logger = logging.getLogger(__name__)
+
+CARDS_PATH = os.getenv("CARDS_PATH", "./data/cards")
+CARDS_CACHE_MAX_AGE = int(os.getenv("CARDS_CACHE_MAX_AGE", "3600"))
+# Internal nginx location that serves CARDS_PATH, e.g. /_cards/; empty streams files from Python
+CARDS_ACCEL_REDIRECT = os.getenv("CARDS_ACCEL_REDIRECT", "")
+CARD_MANIFEST_NAME = "card_manifest.json"
+
+# <name>.<12 hex digits of sha256>.<ext>, as written by compress_cards.py
+HASHED_NAME = re.compile(r"\.[0-9a-f]{12}\.[A-Za-z0-9]+$")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+def load_card_variants(cards_path: str = CARDS_PATH) -> Dict[str, Tuple[CardVariantOut, ...]]:
+    variants: Dict[str, Tuple[CardVariantOut, ...]] = {}
+    root = Path(cards_path)
+    if not root.is_dir():
+        return variants
+
+    for manifest_path in sorted(root.glob(f"**/{CARD_MANIFEST_NAME}")):
+        try:
+            manifest = orjson.loads(manifest_path.read_bytes())
+            for image_path, entries in manifest.get("cards", {}).items():
+                # Smallest first, so clients can take the first one that is wide enough
+                variants[image_path] = tuple(sorted(
+                    (CardVariantOut(**entry) for entry in entries),
+                    key=lambda v: (v.width, v.bytes)
+                ))
+        except (OSError, ValueError, TypeError, ValidationError):
+            logger.exception("Skipping unreadable card manifest %s", manifest_path)
+    return variants
+
+
+def cache_control(path: str) -> str:
+    if HASHED_NAME.search(path):
+        return IMMUTABLE
+    return f"public, max-age={CARDS_CACHE_MAX_AGE}"
+
+
+def preload_links(images: Iterable[CardImageOut]) -> str:
+    """``Link: rel=preload`` value for upcoming card images, WebP variants as a srcset."""
+    links = []
+    for image in images:
+        webp = [v for v in image.variants if v.format == "webp"]
+        if not webp:
+            links.append(f"</cards/{quote(image.image_path)}>; rel=preload; as=image")
+            continue
+        srcset = ", ".join(f"/cards/{quote(v.path)} {v.width}w" for v in webp)
+        links.append(
+            f'</cards/{quote(webp[-1].path)}>; rel=preload; as=image; '
+            f'imagesrcset="{srcset}"; imagesizes="100vw"'
+        )
+    return ", ".join(links)
+
+
+class CardFiles(StaticFiles):
+    """StaticFiles with cache headers and an optional X-Accel-Redirect hand-off.
+
+    With CARDS_ACCEL_REDIRECT set, the worker only resolves the file and its
+    ETag; nginx sends the bytes itself (sendfile) from the internal location.
+    """
+
+    def __init__(self, *args, accel_redirect: str = CARDS_ACCEL_REDIRECT, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.accel_redirect = accel_redirect.rstrip("/")
+
+    def file_response(self, full_path, stat_result, scope, status_code: int = 200) -> Response:
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        rel_path = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+        response.headers["Cache-Control"] = cache_control(rel_path)
+
+        if self.accel_redirect and isinstance(response, FileResponse):
+            headers = {k: v for k, v in response.headers.items() if k != "content-length"}
+            headers["X-Accel-Redirect"] = f"{self.accel_redirect}/{quote(rel_path)}"
+            return Response(status_code=response.status_code, headers=headers)
+        return response
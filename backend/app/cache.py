@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import NamedTuple, Optional, Set
+
+from .schemas import RoomStateOut
+
+ROOM_STATE_CACHE_SIZE = int(os.getenv("ROOM_STATE_CACHE_SIZE", "1024"))
+ROOM_STATE_CACHE_TTL = float(os.getenv("ROOM_STATE_CACHE_TTL", "10"))
+ROOM_CHANGE_LOG_LENGTH = int(os.getenv("ROOM_CHANGE_LOG_LENGTH", "32"))
+
+
+class CachedRoomState(NamedTuple):
+    version: int
+    payload: bytes
+    state: RoomStateOut
+
+
+class RoomStateCache:
+    """LRU + TTL cache of pre-serialized room states, keyed by room code."""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # Sync route handlers run in the threadpool, so access must be guarded
+        self._lock = threading.Lock()
+
+    def get(self, room_code: str) -> Optional[CachedRoomState]:
+        with self._lock:
+            entry = self._entries.get(room_code)
+            if entry is None:
+                return None
+            expires_at, cached = entry
+            if expires_at < time.monotonic():
+                del self._entries[room_code]
+                return None
+            self._entries.move_to_end(room_code)
+            return cached
+
+    def set(self, room_code: str, cached: CachedRoomState):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            current = self._entries.get(room_code)
+            # Never let a slower, older write replace a newer state
+            if current is not None and current[1].version > cached.version:
+                return
+            self._entries[room_code] = (time.monotonic() + self.ttl, cached)
+            self._entries.move_to_end(room_code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, room_code: str):
+        with self._lock:
+            self._entries.pop(room_code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class RoomChangeLog:
+    """Remembers which players changed in the last few versions of each room.
+
+    Used to answer ``?since=<version>`` with a delta instead of a snapshot.
+    """
+
+    def __init__(self, max_rooms: int, max_versions: int):
+        self.max_rooms = max_rooms
+        self.max_versions = max_versions
+        self._rooms: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, room_code: str, version: int, player_ids: Set[int]):
+        with self._lock:
+            changes = self._rooms.get(room_code)
+            if changes is None:
+                changes = self._rooms[room_code] = deque(maxlen=self.max_versions)
+            changes.append((version, frozenset(player_ids)))
+            self._rooms.move_to_end(room_code)
+            while len(self._rooms) > self.max_rooms:
+                self._rooms.popitem(last=False)
+
+    def changed_since(self, room_code: str, since: int, version: int) -> Optional[Set[int]]:
+        """Ids of players changed after ``since``, or None if that history is gone."""
+        with self._lock:
+            changes = self._rooms.get(room_code)
+            if not changes:
+                return None
+            known = {v: ids for v, ids in changes}
+        changed: Set[int] = set()
+        for v in range(since + 1, version + 1):
+            if v not in known:
+                return None
+            changed |= known[v]
+        return changed
+
+    def forget(self, room_code: str):
+        with self._lock:
+            self._rooms.pop(room_code, None)
+
+    def clear(self):
+        with self._lock:
+            self._rooms.clear()
+
+
+class LeaderboardCache:
+    """Encoded leaderboards of finished rooms.
+
+    Scores cannot change once a game is over, so entries have no TTL; they
+    are only evicted by size or dropped by the reaper together with the room.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, room_code: str) -> Optional[bytes]:
+        with self._lock:
+            payload = self._entries.get(room_code)
+            if payload is not None:
+                self._entries.move_to_end(room_code)
+            return payload
+
+    def set(self, room_code: str, payload: bytes):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[room_code] = payload
+            self._entries.move_to_end(room_code)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, room_code: str):
+        with self._lock:
+            self._entries.pop(room_code, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+room_state_cache = RoomStateCache(ROOM_STATE_CACHE_SIZE, ROOM_STATE_CACHE_TTL)
+room_changes = RoomChangeLog(ROOM_STATE_CACHE_SIZE, ROOM_CHANGE_LOG_LENGTH)
+leaderboard_cache = LeaderboardCache(ROOM_STATE_CACHE_SIZE)
@@ -0,0 +1,168 @@
+import asyncio
+import logging
+import os
+import time
+from types import MappingProxyType
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+
+from .assets import load_card_variants
+from .database import run_db
+from .models import Game, Card
+from .schemas import CardOut, GameOut
+
+logger = logging.getLogger(__name__)
+
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))
+# A lookup miss reloads the catalog, but at most this often
+CATALOG_MISS_RELOAD = 5.0
+
+
+class CatalogSnapshot(NamedTuple):
+    games: Mapping[int, GameOut]
+    cards: Mapping[int, CardOut]
+    game_cards: Mapping[int, Tuple[int, ...]]  # game_id -> card ids
+    loaded_at: float
+
+
+class CardCatalog:
+    """Process-wide, read-only view of every Game and Card.
+
+    Card data only changes when an admin edits the DB, so all routers read
+    from an immutable snapshot that is rebuilt after CATALOG_TTL seconds or
+    when reload() is called.
+
+    An expired snapshot keeps being served while one background reload
+    (stale-while-revalidate) rebuilds it, so the TTL never makes a burst of
+    requests reload the catalog together.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._snapshot: Optional[CatalogSnapshot] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._reload: Optional[asyncio.Future] = None
+
+    def current(self) -> Optional[CatalogSnapshot]:
+        """The snapshot if it is still fresh, without touching the DB."""
+        snapshot = self._snapshot
+        if snapshot is None or time.monotonic() - snapshot.loaded_at > self.ttl:
+            return None
+        return snapshot
+
+    def snapshot(self, db: Session) -> CatalogSnapshot:
+        snapshot = self._snapshot
+        if snapshot is None:
+            return self.refresh(db)
+        if time.monotonic() - snapshot.loaded_at > self.ttl:
+            self._reload_soon()
+        return snapshot
+
+    async def latest(self) -> CatalogSnapshot:
+        """Like snapshot(), for async code: only waits when nothing is loaded yet."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            return await self.reload()
+        if time.monotonic() - snapshot.loaded_at > self.ttl:
+            self._start_reload()
+        return snapshot
+
+    async def reload(self) -> CatalogSnapshot:
+        """Rebuild the snapshot; concurrent callers share one rebuild."""
+        self._start_reload()
+        return await asyncio.shield(self._reload)
+
+    def _start_reload(self):
+        # Event loop only
+        if self._reload is None:
+            self._loop = asyncio.get_running_loop()
+            self._reload = asyncio.ensure_future(self._rebuild())
+            self._reload.add_done_callback(self._reload_done)
+
+    def _reload_soon(self):
+        # Called from DB code: a threadpool thread, or the loop thread with an async driver
+        loop = self._loop
+        if loop is not None and self._reload is None:
+            loop.call_soon_threadsafe(self._start_reload)
+
+    def _reload_done(self, future: asyncio.Future):
+        self._reload = None
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Catalog reload failed", exc_info=future.exception())
+
+    async def _rebuild(self) -> CatalogSnapshot:
+        # Manifests are read in the threadpool, never on the event loop
+        variants = await run_in_threadpool(load_card_variants)
+        return await run_db(self.refresh, variants)
+
+    def refresh(self, db: Session, variants: Optional[Dict] = None) -> CatalogSnapshot:
+        """Rebuild the snapshot synchronously on ``db``; prefer reload() from async code."""
+        games = db.query(Game).order_by(Game.id).all()
+        cards = db.query(Card).order_by(Card.id).all()
+        if variants is None:
+            variants = load_card_variants()
+
+        game_cards: Dict[int, List[int]] = {g.id: [] for g in games}
+        card_table = {}
+        for c in cards:
+            card_table[c.id] = CardOut(
+                id=c.id,
+                image_path=c.image_path,
+                card_type=c.card_type.value,
+                drink_points=c.drink_points,
+                action_points=c.action_points,
+                variants=list(variants.get(c.image_path, ()))
+            )
+            game_cards.setdefault(c.game_id, []).append(c.id)
+
+        game_table = {
+            g.id: GameOut(
+                id=g.id,
+                name=g.name,
+                description=g.description,
+                cards_count=len(game_cards[g.id])
+            )
+            for g in games
+        }
+
+        snapshot = CatalogSnapshot(
+            games=MappingProxyType(game_table),
+            cards=MappingProxyType(card_table),
+            game_cards=MappingProxyType({k: tuple(v) for k, v in game_cards.items()}),
+            loaded_at=time.monotonic()
+        )
+        self._snapshot = snapshot
+        return snapshot
+
+    def invalidate(self):
+        """Expire the snapshot; it keeps being served until the reload it triggers finishes."""
+        snapshot = self._snapshot
+        if snapshot is not None:
+            self._snapshot = snapshot._replace(loaded_at=float("-inf"))
+
+    def _reload_on_miss(self, db: Session) -> CatalogSnapshot:
+        snapshot = self.snapshot(db)
+        if time.monotonic() - snapshot.loaded_at < CATALOG_MISS_RELOAD:
+            return snapshot
+        return self.refresh(db)
+
+    def get_game(self, db: Session, game_id: int) -> Optional[GameOut]:
+        game = self.snapshot(db).games.get(game_id)
+        if game is None:
+            game = self._reload_on_miss(db).games.get(game_id)
+        return game
+
+    def card_ids(self, db: Session, game_id: int) -> Tuple[int, ...]:
+        return self.snapshot(db).game_cards.get(game_id, ())
+
+    def get_card(self, db: Session, card_id: int) -> Optional[CardOut]:
+        card = self.snapshot(db).cards.get(card_id)
+        if card is None:
+            # The card may have been added after the snapshot was taken
+            card = self._reload_on_miss(db).cards.get(card_id)
+        return card
+
+
+catalog = CardCatalog(CATALOG_TTL)
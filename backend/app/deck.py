@@ -0,0 +1,72 @@
+"""Compact deck: a room's shuffled card ids packed into one bytea column."""
+import os
+import struct
+from typing import List, Optional, Sequence
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .catalog import catalog
+from .models import Room, RoomCard
+from .schemas import CardImageOut, CardOut
+
+CARD_PREFETCH_COUNT = int(os.getenv("CARD_PREFETCH_COUNT", "2"))
+
+_ID = struct.Struct("<I")
+
+
+def pack_deck(card_ids: Sequence[int]) -> bytes:
+    return struct.pack(f"<{len(card_ids)}I", *card_ids)
+
+
+def unpack_deck(data: bytes) -> List[int]:
+    return list(struct.unpack(f"<{len(data) // _ID.size}I", data))
+
+
+def total_cards(db: Session, room: Room) -> int:
+    if room.deck is not None:
+        return len(room.deck) // _ID.size
+    # Rooms created before compact decks keep one RoomCard row per card
+    return db.query(func.count(RoomCard.id)).filter(RoomCard.room_id == room.id).scalar()
+
+
+def card_id_at(db: Session, room: Room, index: int) -> Optional[int]:
+    if room.deck is not None:
+        if index < 0 or index >= len(room.deck) // _ID.size:
+            return None
+        return _ID.unpack_from(room.deck, index * _ID.size)[0]
+    return db.query(RoomCard.card_id).filter(
+        RoomCard.room_id == room.id,
+        RoomCard.order_index == index
+    ).scalar()
+
+
+def card_at(db: Session, room: Room, index: int) -> Optional[CardOut]:
+    card_id = card_id_at(db, room, index)
+    if card_id is None:
+        return None
+    return catalog.get_card(db, card_id)
+
+
+def upcoming_card_ids(db: Session, room: Room, count: int = CARD_PREFETCH_COUNT) -> List[int]:
+    """Ids of the ``count`` cards after the current one, in deck order."""
+    start = room.current_card_index + 1
+    if count <= 0:
+        return []
+    if room.deck is not None:
+        end = min(start + count, len(room.deck) // _ID.size)
+        return [_ID.unpack_from(room.deck, i * _ID.size)[0] for i in range(start, end)]
+    return [card_id for (card_id,) in db.query(RoomCard.card_id).filter(
+        RoomCard.room_id == room.id,
+        RoomCard.order_index >= start,
+        RoomCard.order_index < start + count
+    ).order_by(RoomCard.order_index)]
+
+
+def card_image(card: CardOut) -> CardImageOut:
+    return CardImageOut(image_path=card.image_path, variants=card.variants)
+
+
+def next_card_images(db: Session, room: Room, count: int = CARD_PREFETCH_COUNT) -> List[CardImageOut]:
+    cards = (catalog.get_card(db, card_id) for card_id in upcoming_card_ids(db, room, count))
+    return [card_image(card) for card in cards if card is not None]
@@ -0,0 +1,21 @@
+"""orjson helpers shared by the HTTP routes and the WebSocket layer."""
+from typing import Any, Optional
+
+import orjson
+from fastapi.responses import Response
+
+loads = orjson.loads
+
+
+def dumps(obj: Any) -> str:
+    """Encode to str for WebSocket text frames and NOTIFY payloads."""
+    return orjson.dumps(obj).decode()
+
+
+def json_response(payload: bytes, etag: Optional[str] = None) -> Response:
+    """Return already encoded JSON as-is, skipping response_model validation and re-encoding."""
+    return Response(
+        content=payload,
+        media_type="application/json",
+        headers={"ETag": etag} if etag else None
+    )
@@ -0,0 +1,522 @@
+"""Optional room actor engine (ROOM_ENGINE=actor).
+
+Each active room is owned by one RoomActor that keeps the authoritative
+state in memory and runs commands one at a time from an asyncio queue.
+Changes are written back to the DB in batches by a single flush loop
+(write-behind), and a room is rehydrated from the DB the first time it is
+touched after a restart.
+
+Actors live in one process, so this mode needs every request for a room to
+reach the same worker (run a single worker, or pin rooms at the proxy).
+"""
+import asyncio
+import datetime
+import logging
+import os
+import random
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .catalog import CatalogSnapshot, catalog
+from .database import run_db
+from .deck import CARD_PREFETCH_COUNT, card_image, unpack_deck
+from .models import Room, Player, RoomCard, GameStatus
+from .schemas import PlayerChoice, PlayerOut, RoomOut, RoomStateOut
+
+logger = logging.getLogger(__name__)
+
+ROOM_ENGINE = os.getenv("ROOM_ENGINE", "db")
+ENGINE_FLUSH_INTERVAL = float(os.getenv("ENGINE_FLUSH_INTERVAL", "0.5"))
+ENGINE_IDLE_TIMEOUT = float(os.getenv("ENGINE_IDLE_TIMEOUT", "900"))
+
+
+class PlayerState:
+    __slots__ = ("id", "nickname", "is_host", "drink_score", "action_score", "play_order")
+
+    def __init__(self, player: Player):
+        self.id = player.id
+        self.nickname = player.nickname
+        self.is_host = player.is_host
+        self.drink_score = player.drink_score or 0
+        self.action_score = player.action_score or 0
+        self.play_order = player.play_order
+
+    def to_out(self) -> PlayerOut:
+        return PlayerOut(
+            id=self.id,
+            nickname=self.nickname,
+            is_host=self.is_host,
+            drink_score=self.drink_score,
+            action_score=self.action_score
+        )
+
+
+class RoomState:
+    __slots__ = (
+        "id", "code", "game_id", "status", "current_player_index", "current_card_index",
+        "chosen_card_index", "version", "deck", "players", "playing"
+    )
+
+    def __init__(self, room: Room, players: List[Player], deck: Tuple[int, ...]):
+        self.id = room.id
+        self.code = room.code
+        self.game_id = room.game_id
+        self.status = room.status
+        self.current_player_index = room.current_player_index or 0
+        self.current_card_index = room.current_card_index or 0
+        self.chosen_card_index = room.chosen_card_index
+        self.version = room.version
+        self.deck = deck
+        self.players = {p.id: PlayerState(p) for p in sorted(players, key=lambda p: p.id)}
+        self.playing: List[PlayerState] = []
+        self.reorder()
+
+    def reorder(self):
+        self.playing = sorted(
+            (p for p in self.players.values() if not p.is_host),
+            key=lambda p: (p.play_order is None, p.play_order or 0)
+        )
+
+    def current_player(self) -> Optional[PlayerState]:
+        if self.current_player_index < len(self.playing):
+            return self.playing[self.current_player_index]
+        return None
+
+    def to_out(self, snapshot: CatalogSnapshot) -> RoomStateOut:
+        game = snapshot.games.get(self.game_id)
+        current_card = None
+        current_player = None
+        next_cards = []
+        if self.status == GameStatus.PLAYING:
+            if self.current_card_index < len(self.deck):
+                current_card = snapshot.cards.get(self.deck[self.current_card_index])
+            player = self.current_player()
+            current_player = player.to_out() if player else None
+            start = self.current_card_index + 1
+            upcoming = (snapshot.cards.get(card_id) for card_id in self.deck[start:start + CARD_PREFETCH_COUNT])
+            next_cards = [card_image(card) for card in upcoming if card is not None]
+
+        return RoomStateOut(
+            room=RoomOut(
+                id=self.id,
+                code=self.code,
+                game_id=self.game_id,
+                game_name=game.name if game else "",
+                status=self.status.value,
+                players=[p.to_out() for p in self.players.values()],
+                current_player_index=self.current_player_index,
+                current_card_index=self.current_card_index,
+                total_cards=len(self.deck),
+                version=self.version
+            ),
+            current_card=current_card,
+            current_player=current_player,
+            next_cards=next_cards
+        )
+
+
+class CommandResult(NamedTuple):
+    response: dict
+    state: RoomStateOut
+    event: str
+    changed_player_ids: Tuple[int, ...]
+    extra: dict
+
+
+def load_room_state(db: Session, room_code: str) -> RoomState:
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    players = db.query(Player).filter(Player.room_id == room.id).all()
+    if room.deck is not None:
+        deck = tuple(unpack_deck(room.deck))
+    else:
+        # Legacy rooms created before the packed deck column
+        deck = tuple(card_id for (card_id,) in db.query(RoomCard.card_id).filter(
+            RoomCard.room_id == room.id
+        ).order_by(RoomCard.order_index))
+    return RoomState(room, players, deck)
+
+
+def persist_changes(db: Session, rooms: List[dict], players: List[dict]):
+    """One executemany UPDATE per table for everything dirtied since the last flush."""
+    if rooms:
+        db.execute(update(Room), rooms)
+    if players:
+        db.execute(update(Player), players)
+    db.commit()
+
+
+# Commands run inside the actor, one at a time, and only touch memory.
+
+def _check_turn(state: RoomState, player_id: int):
+    if state.status != GameStatus.PLAYING:
+        raise HTTPException(status_code=400, detail="Game not in progress")
+    current = state.current_player()
+    if current is None or current.id != player_id:
+        if player_id not in state.players:
+            raise HTTPException(status_code=403, detail="Invalid player")
+        raise HTTPException(status_code=403, detail="Not your turn")
+
+
+def _apply_choice(state: RoomState, snapshot: CatalogSnapshot, player_id: int, choice: PlayerChoice):
+    card = None
+    if state.current_card_index < len(state.deck):
+        card = snapshot.cards.get(state.deck[state.current_card_index])
+    if not card:
+        raise HTTPException(status_code=400, detail="No card available")
+    if state.chosen_card_index == state.current_card_index:
+        raise HTTPException(status_code=400, detail="Choice already made")
+
+    player = state.players[player_id]
+    if choice == PlayerChoice.DRINK:
+        player.drink_score += card.drink_points
+    elif choice == PlayerChoice.ACTION:
+        player.action_score += card.action_points
+    state.chosen_card_index = state.current_card_index
+
+
+def _advance(state: RoomState) -> bool:
+    state.current_card_index += 1
+    if state.current_card_index >= len(state.deck):
+        state.status = GameStatus.FINISHED
+        return True
+    state.current_player_index = (state.current_player_index + 1) % len(state.playing)
+    return False
+
+
+def start_command(actor: "RoomActor", snapshot: CatalogSnapshot, player_id: int) -> CommandResult:
+    state = actor.state
+    player = state.players.get(player_id)
+    if not player or not player.is_host:
+        raise HTTPException(status_code=403, detail="Only host can start the game")
+    if state.status != GameStatus.WAITING:
+        raise HTTPException(status_code=400, detail="Game already started")
+    if not state.playing:
+        raise HTTPException(status_code=400, detail="Need at least 1 player (besides host)")
+
+    order = list(state.playing)
+    random.shuffle(order)
+    for idx, p in enumerate(order):
+        p.play_order = idx
+    state.reorder()
+    state.status = GameStatus.PLAYING
+    state.current_player_index = 0
+    state.current_card_index = 0
+    actor.mark_dirty(p.id for p in order)
+    return actor.result(snapshot, {"status": "started"}, "game_started")
+
+
+def choice_command(
+    actor: "RoomActor",
+    snapshot: CatalogSnapshot,
+    player_id: int,
+    choice: PlayerChoice
+) -> CommandResult:
+    _check_turn(actor.state, player_id)
+    _apply_choice(actor.state, snapshot, player_id, choice)
+    actor.mark_dirty([player_id])
+    return actor.result(
+        snapshot, {"status": "choice_made", "choice": choice.value}, "choice_made",
+        changed_player_ids=(player_id,), player=player_id, choice=choice.value
+    )
+
+
+def next_command(actor: "RoomActor", snapshot: CatalogSnapshot, player_id: int) -> CommandResult:
+    _check_turn(actor.state, player_id)
+    finished = _advance(actor.state)
+    actor.mark_dirty()
+    if finished:
+        return actor.result(snapshot, {"status": "game_finished"}, "game_finished")
+    return actor.result(snapshot, {"status": "next_turn"}, "turn_complete")
+
+
+def turn_command(
+    actor: "RoomActor",
+    snapshot: CatalogSnapshot,
+    player_id: int,
+    choice: PlayerChoice
+) -> CommandResult:
+    _check_turn(actor.state, player_id)
+    _apply_choice(actor.state, snapshot, player_id, choice)
+    finished = _advance(actor.state)
+    actor.mark_dirty([player_id])
+    return actor.result(
+        snapshot,
+        {"status": "game_finished" if finished else "next_turn", "choice": choice.value},
+        "game_finished" if finished else "turn_complete",
+        changed_player_ids=(player_id,), player=player_id, choice=choice.value
+    )
+
+
+class ActorRetired(Exception):
+    """The actor stopped taking commands; the caller retries on a fresh one."""
+
+
+def _retire(actor: "RoomActor") -> None:
+    # Queued like a command, so it runs after everything queued before it
+    actor.retired = True
+
+
+class RoomActor:
+    def __init__(self, state: RoomState, engine: "RoomEngine"):
+        self.state = state
+        self.engine = engine
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.dirty_room = False
+        self.dirty_players: Set[int] = set()
+        self.last_used = time.monotonic()
+        self.retired = False
+        # Set once the actor is out of the engine, so retried commands load its successor
+        self.gone = asyncio.Event()
+        self.task = asyncio.create_task(self._run())
+
+    async def call(self, command: Callable[..., Any], *args: Any) -> Any:
+        if self.retired:
+            raise ActorRetired()
+        self.last_used = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((command, args, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            command, args, future = await self.queue.get()
+            if self.retired:
+                if not future.done():
+                    future.set_exception(ActorRetired())
+                continue
+            try:
+                result = command(self, *args)
+            except Exception as exc:
+                if not future.done():
+                    future.set_exception(exc)
+            else:
+                if not future.done():
+                    future.set_result(result)
+
+    def mark_dirty(self, player_ids=()):
+        self.state.version += 1
+        self.dirty_room = True
+        self.dirty_players.update(player_ids)
+        if self.state.status == GameStatus.FINISHED:
+            # Leaderboards read the DB, so finished games are written right away
+            self.engine.flush_soon()
+
+    def result(
+        self,
+        snapshot: CatalogSnapshot,
+        response: dict,
+        event: str,
+        changed_player_ids: Tuple[int, ...] = (),
+        **extra
+    ) -> CommandResult:
+        return CommandResult(response, self.state.to_out(snapshot), event, changed_player_ids, extra)
+
+    def take_changes(self) -> Tuple[Optional[dict], List[dict]]:
+        """Snapshot and clear the dirty rows. Later commands dirty the actor again."""
+        state = self.state
+        room_row = None
+        if self.dirty_room:
+            room_row = {
+                "id": state.id,
+                "status": state.status,
+                "current_player_index": state.current_player_index,
+                "current_card_index": state.current_card_index,
+                "chosen_card_index": state.chosen_card_index,
+                "version": state.version,
+                "updated_at": datetime.datetime.utcnow(),
+            }
+        player_rows = [
+            {
+                "id": p.id,
+                "drink_score": p.drink_score,
+                "action_score": p.action_score,
+                "play_order": p.play_order,
+            }
+            for p in (state.players[pid] for pid in self.dirty_players)
+        ]
+        self.dirty_room = False
+        self.dirty_players = set()
+        return room_row, player_rows
+
+    def restore_changes(self, room_row: Optional[dict], player_rows: List[dict]):
+        if room_row is not None:
+            self.dirty_room = True
+        self.dirty_players.update(row["id"] for row in player_rows)
+
+    @property
+    def is_dirty(self) -> bool:
+        return self.dirty_room or bool(self.dirty_players)
+
+    def stop(self, error: Optional[Exception] = None):
+        """Cancel the task and fail whatever is still queued so no caller waits forever."""
+        self.retired = True
+        self.task.cancel()
+        while not self.queue.empty():
+            _, _, future = self.queue.get_nowait()
+            if not future.done():
+                future.set_exception(error or ActorRetired())
+        self.gone.set()
+
+
+class RoomEngine:
+    def __init__(self, flush_interval: float = ENGINE_FLUSH_INTERVAL, idle_timeout: float = ENGINE_IDLE_TIMEOUT):
+        self.flush_interval = flush_interval
+        self.idle_timeout = idle_timeout
+        self.actors: Dict[str, RoomActor] = {}
+        # room code -> [lock, holders and waiters]; an entry lives only while in use
+        self._room_locks: Dict[str, list] = {}
+        self._flush_now: Optional[asyncio.Event] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    async def start(self):
+        self._flush_now = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._stopping = False
+        self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        # Let the loop finish its current write instead of cancelling it mid-transaction
+        self._stopping = True
+        self.flush_soon()
+        if self._flusher is not None:
+            await self._flusher
+        await self.flush()
+        for actor in self.actors.values():
+            actor.stop(HTTPException(status_code=503, detail="Server is shutting down"))
+        self.actors.clear()
+
+    async def actor(self, room_code: str) -> RoomActor:
+        actor = self.actors.get(room_code)
+        if actor is not None:
+            return actor
+        async with self._room_lock(room_code):
+            actor = self.actors.get(room_code)
+            if actor is None:
+                state = await run_db(load_room_state, room_code)
+                actor = self.actors[room_code] = RoomActor(state, self)
+        return actor
+
+    @asynccontextmanager
+    async def _room_lock(self, room_code: str) -> AsyncIterator[None]:
+        """Serializes loading and detaching one room."""
+        entry = self._room_locks.get(room_code)
+        if entry is None:
+            entry = self._room_locks[room_code] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._room_locks[room_code]
+
+    async def execute(self, room_code: str, command: Callable[..., CommandResult], *args: Any) -> CommandResult:
+        snapshot = await catalog.latest()
+        room_code = room_code.upper()
+        while True:
+            actor = await self.actor(room_code)
+            try:
+                return await actor.call(command, snapshot, *args)
+            except ActorRetired:
+                await actor.gone.wait()
+
+    def peek_state(self, room_code: str) -> Optional[RoomStateOut]:
+        """Current in-memory state of an active room, without touching the DB."""
+        actor = self.actors.get(room_code)
+        snapshot = catalog.current()
+        if actor is None or snapshot is None:
+            return None
+        return actor.state.to_out(snapshot)
+
+    async def flush_room(self, room_code: str):
+        actor = self.actors.get(room_code)
+        if actor is not None:
+            await self.flush([actor])
+
+    @asynccontextmanager
+    async def detach(self, room_code: str) -> AsyncIterator[None]:
+        """Write back and drop a room's actor, and keep the room actor-free inside the block.
+
+        The retirement is queued behind the commands already waiting, so their
+        changes are in the flush. Commands arriving later wait until the block
+        ends and then run on an actor reloaded from the DB, which lets the
+        caller change the room's rows directly in between.
+        """
+        async with self._room_lock(room_code):
+            actor = self.actors.get(room_code)
+            if actor is not None:
+                await actor.call(_retire)
+                await self.flush([actor])
+                if actor.is_dirty:
+                    # The write failed; keep serving the room from memory and wake the
+                    # commands turned away meanwhile so they retry on this actor
+                    actor.retired = False
+                    turned_away, actor.gone = actor.gone, asyncio.Event()
+                    turned_away.set()
+                    raise HTTPException(status_code=503, detail="Room is busy, try again")
+                self.actors.pop(room_code, None)
+            try:
+                yield
+            finally:
+                if actor is not None:
+                    actor.stop()
+
+    def flush_soon(self):
+        if self._flush_now is not None:
+            self._flush_now.set()
+
+    async def flush(self, actors: Optional[List[RoomActor]] = None):
+        # Serialized so a caller waiting on flush_room() cannot return while
+        # the loop is still writing the same rows
+        async with self._flush_lock:
+            await self._flush(actors)
+
+    async def _flush(self, actors: Optional[List[RoomActor]]):
+        dirty = [a for a in (actors if actors is not None else list(self.actors.values())) if a.is_dirty]
+        if not dirty:
+            return
+        changes = [(a, a.take_changes()) for a in dirty]
+        rooms = [room_row for _, (room_row, _) in changes if room_row is not None]
+        players = [row for _, (_, player_rows) in changes for row in player_rows]
+        try:
+            await run_db(persist_changes, rooms, players)
+        except Exception:
+            logger.exception("Write-behind flush of %d rooms failed, will retry", len(dirty))
+            for actor, (room_row, player_rows) in changes:
+                actor.restore_changes(room_row, player_rows)
+
+    async def _flush_loop(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            self._evict_idle()
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        for code, actor in list(self.actors.items()):
+            if actor.retired:
+                continue  # detach() owns it until its block ends
+            idle = now - actor.last_used > self.idle_timeout
+            if (idle or actor.state.status == GameStatus.FINISHED) and not actor.is_dirty and actor.queue.empty():
+                actor.stop()
+                del self.actors[code]
+
+
+room_engine: Optional[RoomEngine] = RoomEngine() if ROOM_ENGINE == "actor" else None
+if room_engine is not None:
+    metrics.gauge("doorsip_engine_actors", "Rooms held in memory by the actor engine", lambda: len(room_engine.actors))
@@ -0,0 +1,219 @@
+"""Bulk import of games and cards from the CARDS_PATH directory tree.
+
+Every ``<CARDS_PATH>/<game>/`` folder with card images becomes a Game (matched
+by name) and each image a Card (matched by game and image_path). Card type
+and points come from an optional sidecar next to the images:
+
+* ``cards.json``: ``{"name": ..., "description": ..., "cards": [{"file": "001.png",
+  "card_type": "do_or_drink", "drink_points": 1, "action_points": 2}, ...]}``
+* ``cards.csv``: columns ``file,card_type,drink_points,action_points``
+
+Images without a sidecar row get the model defaults. All games are written
+in one transaction with one executemany INSERT and one UPDATE for cards, and
+only new or changed cards are touched, so re-running is a no-op.
+
+Run with ``python -m app.importer [--compress] [--refresh-url URL] [game ...]``.
+"""
+import argparse
+import asyncio
+import csv
+import json
+import os
+import subprocess
+import sys
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from .assets import CARDS_PATH
+from .models import Game, Card, CardType
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".webp", ".avif"}
+# Output folders of scripts/compress_cards.py, not games of their own
+COMPRESSED_SUFFIX = "_webp"
+COMPRESS_SCRIPT = Path(__file__).resolve().parents[2] / "scripts" / "compress_cards.py"
+IMPORT_REFRESH_URL = os.getenv("IMPORT_REFRESH_URL", "http://localhost:8000/api/games/refresh")
+
+CARD_FIELDS = ("card_type", "drink_points", "action_points")
+CARD_DEFAULTS = {"card_type": CardType.DO_OR_DRINK, "drink_points": 1, "action_points": 1}
+
+
+class GameSpec(NamedTuple):
+    name: str
+    description: Optional[str]
+    cards: Dict[str, dict]  # image_path -> card fields
+
+
+def _card_fields(row: dict, source: str) -> dict:
+    fields = dict(CARD_DEFAULTS)
+    try:
+        if row.get("card_type"):
+            fields["card_type"] = CardType(row["card_type"])
+        for key in ("drink_points", "action_points"):
+            if row.get(key) not in (None, ""):
+                fields[key] = int(row[key])
+    except ValueError as exc:
+        raise ValueError(f"{source}: {exc}") from exc
+    return fields
+
+
+def read_sidecar(game_dir: Path) -> dict:
+    """Game metadata and per-file card rows from cards.json or cards.csv."""
+    json_path = game_dir / "cards.json"
+    csv_path = game_dir / "cards.csv"
+    if json_path.exists():
+        data = json.loads(json_path.read_text(encoding="utf-8"))
+        rows = data.get("cards", [])
+        if isinstance(rows, dict):
+            rows = [{"file": name, **fields} for name, fields in rows.items()]
+        return {"name": data.get("name"), "description": data.get("description"), "rows": rows}
+    if csv_path.exists():
+        with open(csv_path, newline="", encoding="utf-8") as f:
+            return {"name": None, "description": None, "rows": list(csv.DictReader(f))}
+    return {"name": None, "description": None, "rows": []}
+
+
+def scan_game(cards_root: Path, game_dir: Path) -> GameSpec:
+    sidecar = read_sidecar(game_dir)
+    rows = {row["file"]: row for row in sidecar["rows"]}
+    cards = {}
+    for image in sorted(p for p in game_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+        image_path = image.relative_to(cards_root).as_posix()
+        cards[image_path] = _card_fields(rows.get(image.name, {}), image_path)
+
+    unknown = set(rows) - {Path(p).name for p in cards}
+    if unknown:
+        raise ValueError(f"{game_dir.name}: sidecar lists missing images: {', '.join(sorted(unknown))}")
+    return GameSpec(sidecar["name"] or game_dir.name, sidecar["description"], cards)
+
+
+def find_game_dirs(cards_root: Path, names: List[str]) -> List[Path]:
+    dirs = [
+        d for d in sorted(cards_root.iterdir())
+        if d.is_dir() and not d.name.endswith(COMPRESSED_SUFFIX)
+        and any(p.suffix.lower() in IMAGE_SUFFIXES for p in d.iterdir())
+    ]
+    if names:
+        missing = set(names) - {d.name for d in dirs}
+        if missing:
+            raise ValueError(f"No card folders named: {', '.join(sorted(missing))}")
+        dirs = [d for d in dirs if d.name in names]
+    return dirs
+
+
+def import_games(db: Session, specs: List[GameSpec], dry_run: bool = False) -> Dict[str, int]:
+    """Upsert games and cards in one transaction. Returns counts of what changed."""
+    stats = {"games_created": 0, "games_updated": 0, "cards_created": 0, "cards_updated": 0, "cards_unchanged": 0}
+
+    games = {g.name: g for g in db.query(Game).filter(Game.name.in_([s.name for s in specs]))}
+    for spec in specs:
+        game = games.get(spec.name)
+        if game is None:
+            game = games[spec.name] = Game(name=spec.name, description=spec.description)
+            db.add(game)
+            stats["games_created"] += 1
+        elif spec.description is not None and game.description != spec.description:
+            game.description = spec.description
+            stats["games_updated"] += 1
+    db.flush()
+
+    game_ids = [games[s.name].id for s in specs]
+    existing = {
+        (c.game_id, c.image_path): c
+        for c in db.query(Card.id, Card.game_id, Card.image_path, *[getattr(Card, f) for f in CARD_FIELDS])
+        .filter(Card.game_id.in_(game_ids))
+    }
+
+    inserts = []
+    updates = []
+    for spec in specs:
+        game_id = games[spec.name].id
+        for image_path, fields in spec.cards.items():
+            current = existing.get((game_id, image_path))
+            if current is None:
+                inserts.append({"game_id": game_id, "image_path": image_path, **fields})
+            elif any(getattr(current, f) != fields[f] for f in CARD_FIELDS):
+                updates.append({"id": current.id, **fields})
+            else:
+                stats["cards_unchanged"] += 1
+
+    if inserts:
+        db.execute(insert(Card), inserts)
+    if updates:
+        db.execute(update(Card), updates)
+    stats["cards_created"] = len(inserts)
+    stats["cards_updated"] = len(updates)
+
+    if dry_run:
+        db.rollback()
+    else:
+        db.commit()
+    return stats
+
+
+def compress(game_dir: Path, cards_root: Path):
+    if not COMPRESS_SCRIPT.exists():
+        raise RuntimeError(f"Compression script not found at {COMPRESS_SCRIPT}")
+    output_dir = game_dir.parent / (game_dir.name + COMPRESSED_SUFFIX)
+    subprocess.run(
+        [sys.executable, str(COMPRESS_SCRIPT), str(game_dir), str(output_dir), "--cards-root", str(cards_root)],
+        check=True
+    )
+
+
+def refresh_backend(url: str, token: str) -> str:
+    request = urllib.request.Request(url, method="POST", headers={"X-Admin-Token": token})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        return response.read().decode()
+
+
+async def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Import games and cards from the card image folders")
+    parser.add_argument("games", nargs="*", help="Folder names to import (default: all)")
+    parser.add_argument("--cards-dir", default=CARDS_PATH, help="Root of the card folders (default: CARDS_PATH)")
+    parser.add_argument("--compress", action="store_true", help="Run scripts/compress_cards.py on each game first")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change and roll back")
+    parser.add_argument("--refresh-url", default=IMPORT_REFRESH_URL,
+                        help="Catalog refresh endpoint of the running backend (needs ADMIN_TOKEN)")
+    args = parser.parse_args(argv)
+
+    from .database import init_db, run_db
+
+    cards_root = Path(args.cards_dir).resolve()
+    try:
+        game_dirs = find_game_dirs(cards_root, args.games)
+        if args.compress:
+            for game_dir in game_dirs:
+                compress(game_dir, cards_root)
+        specs = [scan_game(cards_root, d) for d in game_dirs]
+    except (OSError, ValueError, RuntimeError, subprocess.CalledProcessError) as exc:
+        sys.exit(f"Import failed: {exc}")
+    if not specs:
+        sys.exit(f"No card folders found in {cards_root}")
+
+    await init_db()
+    stats = await run_db(import_games, specs, args.dry_run)
+    for spec in specs:
+        print(f"{spec.name}: {len(spec.cards)} cards")
+    print(", ".join(f"{key} {value}" for key, value in stats.items()) + (" (dry run)" if args.dry_run else ""))
+
+    changed = stats["games_created"] + stats["games_updated"] + stats["cards_created"] + stats["cards_updated"]
+    # New compressed variants only show up in the catalog after a refresh too
+    if args.dry_run or not (changed or args.compress):
+        return
+    token = os.getenv("ADMIN_TOKEN", "")
+    if not token:
+        print("ADMIN_TOKEN is not set; the running backend picks the changes up within CATALOG_TTL")
+        return
+    try:
+        print(f"Catalog refreshed: {refresh_backend(args.refresh_url, token)}")
+    except (OSError, urllib.error.URLError) as exc:
+        print(f"Could not refresh the backend catalog at {args.refresh_url}: {exc}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
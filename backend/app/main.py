@@ -1,15 +1,46 @@
+import asyncio
 import os
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import Depends, FastAPI, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from .database import engine, Base
+from .assets import CARDS_PATH, CardFiles
+from .catalog import catalog
+from . import metrics, profiling
+from .admin import require_admin
+from .database import engine, init_db
+from .engine import room_engine
+from .reaper import run_reaper
 from .routers import rooms, games, websocket
 
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="DoOrSip API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await init_db()
+    await catalog.reload()
+    await websocket.manager.start()
+    if room_engine is not None:
+        await room_engine.start()
+    reaper = asyncio.create_task(run_reaper())
+    yield
+    reaper.cancel()
+    if room_engine is not None:
+        # Write back whatever the actors still hold before the process exits
+        await room_engine.stop()
+    await websocket.manager.stop()
 
+
+app = FastAPI(
+    title="DoOrSip API",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
+)
+
+metrics.instrument_engine(engine)
+app.add_middleware(metrics.MetricsMiddleware)
+app.add_middleware(profiling.ProfilingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -18,9 +49,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-CARDS_PATH = os.getenv("CARDS_PATH", "./data/cards")
 if os.path.exists(CARDS_PATH):
-    app.mount("/cards", StaticFiles(directory=CARDS_PATH), name="cards")
+    app.mount("/cards", CardFiles(directory=CARDS_PATH), name="cards")
 
 app.include_router(games.router, prefix="/api/games", tags=["games"])
 app.include_router(rooms.router, prefix="/api/rooms", tags=["rooms"])
@@ -30,3 +60,16 @@ app.include_router(websocket.router, prefix="/ws", tags=["websocket"])
 @app.get("/api/health")
 def health_check():
     return {"status": "ok"}
+
+
+@app.get("/api/metrics", include_in_schema=False)
+def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post("/api/profile", dependencies=[Depends(require_admin)], include_in_schema=False)
+def start_profile_window(seconds: float = Query(10, gt=0)):
+    sampler = profiling.start_window(seconds)
+    if sampler is None:
+        raise HTTPException(status_code=429, detail="A profile window is already running or the rate limit is reached")
+    return {"file": sampler.filename, "seconds": sampler.max_seconds, "dir": profiling.PROFILE_DIR}
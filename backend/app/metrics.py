@@ -0,0 +1,190 @@
+"""In-process metrics served in the Prometheus text format at /api/metrics.
+
+Request latency and per-request DB query counts are recorded by a plain ASGI
+middleware keyed by route template, so the hot path costs a couple of
+perf_counter calls and a bisect. Other modules expose their own live values
+with ``gauge`` and ``counter``; those callbacks only run on scrape.
+"""
+import bisect
+import threading
+import time
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import event
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label value."""
+
+    def __init__(self, name: str, help: str, label: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts..., +Inf count, sum]
+        self._series: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_value: str, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = {key: list(series) for key, series in self._series.items()}
+        for label_value, series in sorted(snapshot.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {cumulative}')
+            cumulative += series[-2]
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{label}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{label}}} {cumulative}")
+        return lines
+
+
+class QueryStats:
+    __slots__ = ("queries", "seconds")
+
+    def __init__(self):
+        self.queries = 0
+        self.seconds = 0.0
+
+
+request_latency = Histogram(
+    "doorsip_http_request_duration_seconds", "HTTP request latency by route", "route", LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    "doorsip_http_request_db_queries", "DB queries issued per HTTP request by route", "route", QUERY_BUCKETS
+)
+request_db_time = Histogram(
+    "doorsip_http_request_db_seconds", "DB time spent per HTTP request by route", "route", LATENCY_BUCKETS
+)
+ws_send_latency = Histogram(
+    "doorsip_ws_send_seconds", "Time from broadcast to the frame being written to a socket", "type", LATENCY_BUCKETS
+)
+
+db_totals = QueryStats()
+_db_lock = threading.Lock()
+# Set per HTTP request by the middleware; run_in_threadpool and run_sync carry it over
+_request_stats: ContextVar[Optional[QueryStats]] = ContextVar("request_query_stats", default=None)
+
+# name -> (type, help, callback)
+_collectors: Dict[str, Tuple[str, str, Callable[[], object]]] = {}
+
+
+def gauge(name: str, help: str, fn: Callable[[], float]):
+    _collectors[name] = ("gauge", help, fn)
+
+
+def counter(name: str, help: str, fn: Callable[[], float]):
+    _collectors[name] = ("counter", help, fn)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_metrics_started", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.seconds += elapsed
+    with _db_lock:
+        db_totals.queries += 1
+        db_totals.seconds += elapsed
+
+
+def instrument_engine(engine):
+    """Count queries and DB time on a sync Engine (``async_engine.sync_engine`` for async drivers)."""
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _route_label(scope: dict) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    # Mounted apps (the /cards static files) leave their prefix in root_path
+    return scope.get("root_path") or "unmatched"
+
+
+class MetricsMiddleware:
+    """Record latency and DB usage of every HTTP request, labelled by route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _request_stats.set(stats)
+        started = time.perf_counter()
+        finished = None
+
+        async def send_wrapper(message):
+            nonlocal finished
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body"):
+                # Background tasks run after this point; they are not part of the latency
+                finished = time.perf_counter()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stats.reset(token)
+            label = _route_label(scope)
+            request_latency.observe(label, (finished or time.perf_counter()) - started)
+            request_queries.observe(label, stats.queries)
+            request_db_time.observe(label, stats.seconds)
+
+
+def render() -> str:
+    lines = []
+    for histogram in (request_latency, request_queries, request_db_time, ws_send_latency):
+        lines.extend(histogram.render())
+    with _db_lock:
+        queries, seconds = db_totals.queries, db_totals.seconds
+    lines += [
+        "# HELP doorsip_db_queries_total DB queries executed by this process",
+        "# TYPE doorsip_db_queries_total counter",
+        f"doorsip_db_queries_total {queries}",
+        "# HELP doorsip_db_query_seconds_total DB time spent by this process",
+        "# TYPE doorsip_db_query_seconds_total counter",
+        f"doorsip_db_query_seconds_total {seconds:.6f}",
+    ]
+    for name, (kind, help, fn) in sorted(_collectors.items()):
+        value = fn()
+        lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+        if isinstance(value, dict):
+            for label, v in sorted(value.items()):
+                lines.append(f'{name}{{{label}}} {v}')
+        else:
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,130 @@
+"""Forward-only schema migrations for databases created before a schema change.
+
+``Base.metadata.create_all`` only creates missing tables; it never adds
+columns or indexes to tables that already exist. Every migration here is
+written to be a no-op on a fresh database where create_all already built
+the current schema, and applied versions are recorded in schema_migrations.
+
+Run standalone with ``python -m app.migrations``.
+"""
+import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Integer, LargeBinary, MetaData, String, Table, inspect, select, text
+)
+from sqlalchemy.engine import Connection
+
+_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    _metadata,
+    Column("version", Integer, primary_key=True),
+    Column("name", String(200), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# Arbitrary key so concurrent workers on PostgreSQL migrate one at a time
+_ADVISORY_LOCK_KEY = 0x646F6F72
+
+
+def _has_column(conn: Connection, table: str, column: str) -> bool:
+    return any(c["name"] == column for c in inspect(conn).get_columns(table))
+
+
+def _has_index(conn: Connection, table: str, index: str) -> bool:
+    return any(i["name"] == index for i in inspect(conn).get_indexes(table))
+
+
+def _add_column(conn: Connection, table: str, column: Column):
+    if _has_column(conn, table, column.name):
+        return
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column.name} {column.type.compile(dialect=conn.dialect)}"
+    if column.server_default is not None:
+        ddl += f" DEFAULT {column.server_default.arg}"
+    if not column.nullable:
+        ddl += " NOT NULL"
+    conn.execute(text(ddl))
+
+
+def _create_index(conn: Connection, table: str, name: str, columns: str, unique: bool = False):
+    if _has_index(conn, table, name):
+        return
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({columns})"))
+
+
+def _m1_room_version(conn: Connection):
+    _add_column(conn, "rooms", Column("version", Integer, nullable=False, server_default="0"))
+
+
+def _m2_compact_deck(conn: Connection):
+    _add_column(conn, "rooms", Column("deck", LargeBinary, nullable=True))
+    _add_column(conn, "rooms", Column("chosen_card_index", Integer, nullable=True))
+
+
+def _m3_hot_lookup_indexes(conn: Connection):
+    _create_index(conn, "room_cards", "ix_room_cards_room_order", "room_id, order_index")
+    _create_index(conn, "players", "ix_players_room_host_order", "room_id, is_host, play_order")
+
+    if not _has_index(conn, "players", "uq_players_room_nickname"):
+        # Rename duplicates left by the old check-then-insert race so the unique index can be built
+        conn.execute(text(
+            "UPDATE players SET nickname = substr(nickname, 1, 40) || '#' || id "
+            "WHERE id NOT IN (SELECT MIN(id) FROM players GROUP BY room_id, nickname)"
+        ))
+        _create_index(conn, "players", "uq_players_room_nickname", "room_id, nickname", unique=True)
+
+
+def _m4_room_activity(conn: Connection):
+    _add_column(conn, "rooms", Column("created_at", DateTime, nullable=True))
+    _add_column(conn, "rooms", Column("updated_at", DateTime, nullable=True))
+    # Existing rooms start their idle clock now, in UTC like every other room timestamp
+    conn.execute(text(
+        "UPDATE rooms SET created_at = :now, updated_at = :now WHERE updated_at IS NULL"
+    ), {"now": datetime.datetime.utcnow()})
+    _create_index(conn, "rooms", "ix_rooms_status_updated", "status, updated_at")
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[Connection], None]]] = [
+    (1, "add rooms.version", _m1_room_version),
+    (2, "add rooms.deck and rooms.chosen_card_index", _m2_compact_deck),
+    (3, "add composite indexes for room, player and deck lookups", _m3_hot_lookup_indexes),
+    (4, "add rooms.created_at / updated_at for the reaper", _m4_room_activity),
+]
+
+
+def migrate(conn: Connection, metadata: Optional[MetaData] = None) -> List[int]:
+    """Create missing tables and apply pending migrations inside the caller's transaction.
+
+    Returns the versions applied.
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY})
+
+    if metadata is not None:
+        metadata.create_all(conn)
+    schema_migrations.create(conn, checkfirst=True)
+    done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+
+    applied = []
+    for version, name, fn in MIGRATIONS:
+        if version in done:
+            continue
+        fn(conn)
+        conn.execute(schema_migrations.insert().values(
+            version=version,
+            name=name,
+            applied_at=datetime.datetime.utcnow()
+        ))
+        applied.append(version)
+    return applied
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    from . import models  # noqa: F401  (registers the tables on Base)
+    from .database import init_db
+
+    asyncio.run(init_db())
@@ -1,6 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, Enum as SQLEnum
+from sqlalchemy import (
+    Column, Integer, String, ForeignKey, Boolean, LargeBinary, Index, DateTime, JSON, Enum as SQLEnum
+)
 from sqlalchemy.orm import relationship
 from .database import Base
+import datetime
 import enum
 
 
@@ -40,6 +43,9 @@ class Card(Base):
 
 class Room(Base):
     __tablename__ = "rooms"
+    __table_args__ = (
+        Index("ix_rooms_status_updated", "status", "updated_at"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     code = Column(String(6), unique=True, index=True, nullable=False)
@@ -47,6 +53,13 @@ class Room(Base):
     status = Column(SQLEnum(GameStatus), default=GameStatus.WAITING)
     current_player_index = Column(Integer, default=0)
     current_card_index = Column(Integer, default=0)
+    version = Column(Integer, nullable=False, default=0, server_default="0")  # Bumped on every state change
+    deck = Column(LargeBinary, nullable=True)  # Shuffled card ids packed as little-endian uint32 (see deck.py)
+    chosen_card_index = Column(Integer, nullable=True)  # Card index the current player already chose on
+    # Naive UTC from the app, not the DB's now() (session-local time on PostgreSQL),
+    # the same clock the reaper's cutoffs and the actor flush use
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)  # Last activity, used by the reaper
 
     game = relationship("Game")
     players = relationship("Player", back_populates="room", cascade="all, delete-orphan")
@@ -55,6 +68,10 @@ class Room(Base):
 
 class Player(Base):
     __tablename__ = "players"
+    __table_args__ = (
+        Index("ix_players_room_host_order", "room_id", "is_host", "play_order"),
+        Index("uq_players_room_nickname", "room_id", "nickname", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
@@ -69,6 +86,9 @@ class Player(Base):
 
 class RoomCard(Base):
     __tablename__ = "room_cards"
+    __table_args__ = (
+        Index("ix_room_cards_room_order", "room_id", "order_index"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     room_id = Column(Integer, ForeignKey("rooms.id"), nullable=False)
@@ -78,3 +98,17 @@ class RoomCard(Base):
 
     room = relationship("Room", back_populates="used_cards")
     card = relationship("Card")
+
+
+class RoomArchive(Base):
+    """Compact record of a reaped room: its final leaderboard as JSON."""
+    __tablename__ = "room_archive"
+
+    id = Column(Integer, primary_key=True, index=True)
+    room_id = Column(Integer, nullable=False)  # Id of the deleted room
+    code = Column(String(6), nullable=False)
+    game_id = Column(Integer, nullable=False)
+    status = Column(SQLEnum(GameStatus), nullable=False)
+    created_at = Column(DateTime)
+    ended_at = Column(DateTime)
+    leaderboard = Column(JSON, nullable=False)
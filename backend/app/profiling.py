@@ -0,0 +1,232 @@
+"""Opt-in sampling profiler that writes speedscope files.
+
+A background thread snapshots every thread's stack with sys._current_frames()
+at PROFILE_INTERVAL, so the event loop (async routes and WebSocket handlers)
+and the threadpool (sync DB work) both show up, one speedscope profile per
+thread. Profiles are started:
+
+* for a random PROFILE_REQUEST_RATE share of HTTP requests under PROFILE_PATH_PREFIX,
+* for one HTTP request or WebSocket connection carrying ``X-Profile: 1`` or
+  ``?profile=1`` together with a valid ``X-Admin-Token``,
+* for a time window across the whole process via ``POST /api/profile``.
+
+At most PROFILE_MAX_PER_MINUTE profiles start per minute and none runs longer
+than PROFILE_MAX_SECONDS, so the feature is safe to leave enabled.
+Open the files at https://www.speedscope.app.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from .admin import is_admin_token
+
+logger = logging.getLogger(__name__)
+
+PROFILE_DIR = os.getenv("PROFILE_DIR", "/tmp/doorsip-profiles")
+# Never sample faster than once per millisecond, whatever is configured
+PROFILE_INTERVAL = max(0.001, float(os.getenv("PROFILE_INTERVAL", "0.005")))
+PROFILE_REQUEST_RATE = float(os.getenv("PROFILE_REQUEST_RATE", "0"))
+PROFILE_PATH_PREFIX = os.getenv("PROFILE_PATH_PREFIX", "/api/")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", "60"))
+PROFILE_MAX_PER_MINUTE = int(os.getenv("PROFILE_MAX_PER_MINUTE", "6"))
+
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+
+FrameKey = Tuple[str, str, int]
+
+
+class Sampler:
+    """Samples all thread stacks until stopped or max_seconds pass, then writes the file."""
+
+    def __init__(self, name: str, interval: float = PROFILE_INTERVAL, max_seconds: float = PROFILE_MAX_SECONDS):
+        self.name = name
+        self.interval = interval
+        self.max_seconds = max_seconds
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        slug = "".join(c if c.isalnum() else "-" for c in name).strip("-")[:60]
+        self.filename = f"{stamp}-{slug}-{uuid.uuid4().hex[:6]}.speedscope.json"
+        self._stop = threading.Event()
+        self._frames: Dict[FrameKey, int] = {}
+        # thread id -> (samples as frame index lists, weights)
+        self._samples: Dict[int, Tuple[List[List[int]], List[float]]] = {}
+        self._thread = threading.Thread(target=self._run, name=f"profiler-{slug}", daemon=True)
+
+    def start(self) -> "Sampler":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Non-blocking: the sampler thread writes the file on its way out."""
+        self._stop.set()
+
+    def _frame_index(self, code) -> int:
+        key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+        index = self._frames.get(key)
+        if index is None:
+            index = self._frames[key] = len(self._frames)
+        return index
+
+    def _sample(self, own_id: int, weight: float):
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_index(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            samples, weights = self._samples.setdefault(thread_id, ([], []))
+            samples.append(stack)
+            weights.append(weight)
+
+    def _run(self):
+        own_id = threading.get_ident()
+        started = last = time.perf_counter()
+        try:
+            # One sample up front so even a request shorter than the interval shows where it was
+            self._sample(own_id, self.interval)
+            while not self._stop.wait(self.interval):
+                now = time.perf_counter()
+                self._sample(own_id, now - last)
+                last = now
+                if now - started >= self.max_seconds:
+                    break
+            self._write(time.perf_counter() - started)
+        except Exception:
+            logger.exception("Profiler %s failed", self.name)
+        finally:
+            _release(self)
+
+    def _write(self, duration: float):
+        names = {t.ident: t.name for t in threading.enumerate()}
+        profiles = [
+            {
+                "type": "sampled",
+                "name": f"{names.get(thread_id, 'thread')} ({thread_id})",
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": samples,
+                "weights": weights,
+            }
+            # Busiest thread first, speedscope opens the first profile
+            for thread_id, (samples, weights) in sorted(self._samples.items(), key=lambda item: -len(item[1][0]))
+        ]
+        frames = [{"name": name, "file": file, "line": line} for name, file, line in self._frames]
+        document = {
+            "$schema": SPEEDSCOPE_SCHEMA,
+            "name": f"{self.name} ({duration:.2f}s)",
+            "exporter": "doorsip",
+            "shared": {"frames": frames},
+            "profiles": profiles,
+        }
+        directory = Path(PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / self.filename).write_text(json.dumps(document), encoding="utf-8")
+        logger.info("Wrote profile %s", directory / self.filename)
+
+
+_lock = threading.Lock()
+_started: Deque[float] = deque()
+_window: Optional[Sampler] = None
+
+
+def _release(sampler: Sampler):
+    global _window
+    with _lock:
+        if _window is sampler:
+            _window = None
+
+
+def _take_budget() -> bool:
+    # Caller holds _lock
+    now = time.monotonic()
+    while _started and now - _started[0] > 60:
+        _started.popleft()
+    if len(_started) >= PROFILE_MAX_PER_MINUTE:
+        return False
+    _started.append(now)
+    return True
+
+
+def start_profile(name: str, max_seconds: float = PROFILE_MAX_SECONDS) -> Optional[Sampler]:
+    """Start a sampler unless the per-minute budget is spent. Returns None when refused."""
+    with _lock:
+        if not _take_budget():
+            return None
+    return Sampler(name, max_seconds=min(max_seconds, PROFILE_MAX_SECONDS)).start()
+
+
+def start_window(seconds: float) -> Optional[Sampler]:
+    """Profile the whole process for ``seconds``; only one window runs at a time."""
+    global _window
+    with _lock:
+        if _window is not None or not _take_budget():
+            return None
+        sampler = _window = Sampler("window", max_seconds=min(seconds, PROFILE_MAX_SECONDS))
+    return sampler.start()
+
+
+def _flagged(scope: dict) -> bool:
+    # Cheap byte checks first: this runs on every request
+    query = scope.get("query_string", b"")
+    wanted = b"profile=" in query and parse_qs(query.decode("latin-1")).get("profile", [""])[0] in ("1", "true")
+    token = None
+    for name, value in scope.get("headers") or ():
+        if name == b"x-profile":
+            wanted = wanted or value in (b"1", b"true")
+        elif name == b"x-admin-token":
+            token = value.decode("latin-1")
+    return wanted and is_admin_token(token)
+
+
+def _should_profile(scope: dict) -> bool:
+    if _flagged(scope):
+        return True
+    return (
+        scope["type"] == "http"
+        and PROFILE_REQUEST_RATE > 0
+        and scope["path"].startswith(PROFILE_PATH_PREFIX)
+        and random.random() < PROFILE_REQUEST_RATE
+    )
+
+
+class ProfilingMiddleware:
+    """Profile selected HTTP requests and WebSocket connections.
+
+    HTTP responses name the file in an ``X-Profile-File`` header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket") or not _should_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        method = scope.get("method", "WS")
+        sampler = start_profile(f"{method} {scope['path']}")
+        if sampler is None:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []),
+                                                  (b"x-profile-file", sampler.filename.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            sampler.stop()
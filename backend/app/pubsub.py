@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import os
+from typing import Awaitable, Callable, List, Optional, Set
+
+from sqlalchemy.engine import make_url
+
+from .encoding import dumps, loads
+
+logger = logging.getLogger(__name__)
+
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "doorsip_broadcast")
+
+# PostgreSQL rejects NOTIFY payloads of 8000 bytes or more
+MAX_NOTIFY_PAYLOAD = 7900
+
+# (origin, room_code, data) -> None
+MessageHandler = Callable[[str, str, str], Awaitable[None]]
+
+
+def _without_state(data: str) -> dict:
+    """The broadcast envelope minus its ``data`` field."""
+    try:
+        message = loads(data)
+    except ValueError:
+        message = None
+    if not isinstance(message, dict):
+        return {"type": "state_update"}
+    return {key: value for key, value in message.items() if key != "data"}
+
+
+class PubSubBackend:
+    """Fans room broadcasts out to every ConnectionManager subscribed to the bus."""
+
+    async def subscribe(self, handler: MessageHandler):
+        raise NotImplementedError
+
+    async def unsubscribe(self, handler: MessageHandler):
+        raise NotImplementedError
+
+    async def publish(self, origin: str, room_code: str, data: str):
+        raise NotImplementedError
+
+    async def close(self):
+        pass
+
+
+class InProcessPubSub(PubSubBackend):
+    """Bus for managers living in the same process (single worker or tests)."""
+
+    def __init__(self):
+        self.handlers: List[MessageHandler] = []
+
+    async def subscribe(self, handler: MessageHandler):
+        self.handlers.append(handler)
+
+    async def unsubscribe(self, handler: MessageHandler):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    async def publish(self, origin: str, room_code: str, data: str):
+        for handler in list(self.handlers):
+            await handler(origin, room_code, data)
+
+
+class PostgresPubSub(PubSubBackend):
+    """Bus over PostgreSQL LISTEN/NOTIFY, shared by all workers and containers using the same DB."""
+
+    def __init__(self, dsn: str, channel: str = PUBSUB_CHANNEL):
+        self.dsn = dsn
+        self.channel = channel
+        self.handlers: List[MessageHandler] = []
+        self._listen_conn = None
+        self._pool = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._closing = False
+
+    async def _connect(self):
+        import asyncpg
+
+        if self._pool is None:
+            self._pool = await asyncpg.create_pool(self.dsn, min_size=1, max_size=4)
+        self._listen_conn = await asyncpg.connect(self.dsn)
+        self._listen_conn.add_termination_listener(self._on_terminated)
+        await self._listen_conn.add_listener(self.channel, self._on_notify)
+
+    def _on_terminated(self, conn):
+        if not self._closing:
+            logger.warning("LISTEN connection lost, reconnecting")
+            self._spawn(self._reconnect())
+
+    async def _reconnect(self):
+        delay = 0.5
+        while not self._closing:
+            try:
+                await self._connect()
+                return
+            except Exception:
+                logger.exception("LISTEN reconnect failed")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 10)
+
+    def _spawn(self, coro):
+        task = asyncio.get_running_loop().create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _on_notify(self, conn, pid, channel, payload):
+        # Anyone can NOTIFY the channel; skip payloads not shaped like ours
+        try:
+            message = loads(payload)
+            origin, room_code, data = message["origin"], message["room"], message["data"]
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Ignoring malformed message on %s", self.channel)
+            return
+        for handler in list(self.handlers):
+            self._spawn(handler(origin, room_code, data))
+
+    async def subscribe(self, handler: MessageHandler):
+        self.handlers.append(handler)
+        if self._listen_conn is None:
+            await self._connect()
+
+    async def unsubscribe(self, handler: MessageHandler):
+        if handler in self.handlers:
+            self.handlers.remove(handler)
+
+    async def publish(self, origin: str, room_code: str, data: str):
+        if self._pool is None:
+            return
+        payload = dumps({"origin": origin, "room": room_code, "data": data})
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            # Too big for NOTIFY: send the envelope (event, nickname, ...) without the state,
+            # the other workers' clients refetch it
+            payload = dumps({
+                "origin": origin,
+                "room": room_code,
+                "data": dumps(_without_state(data))
+            })
+        await self._pool.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    async def close(self):
+        self._closing = True
+        if self._listen_conn is not None:
+            await self._listen_conn.close()
+            self._listen_conn = None
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+
+def create_pubsub_backend(name: Optional[str] = None) -> PubSubBackend:
+    name = name or PUBSUB_BACKEND
+    if name == "memory":
+        return InProcessPubSub()
+    if name == "postgres":
+        from .database import DATABASE_URL
+
+        # asyncpg wants a plain postgresql:// DSN without the SQLAlchemy driver suffix
+        dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        return PostgresPubSub(dsn)
+    raise ValueError(f"Unknown PUBSUB_BACKEND: {name}")
@@ -0,0 +1,132 @@
+import asyncio
+import datetime
+import logging
+import os
+from typing import Dict, List
+
+from sqlalchemy import delete, or_, text
+from sqlalchemy.orm import Session
+
+from . import metrics
+from .cache import leaderboard_cache, room_changes, room_state_cache
+from .database import run_db
+from .models import Room, Player, RoomCard, RoomArchive, GameStatus
+
+logger = logging.getLogger(__name__)
+
+ROOM_FINISHED_TTL = int(os.getenv("ROOM_FINISHED_TTL", "3600"))
+ROOM_IDLE_TTL = int(os.getenv("ROOM_IDLE_TTL", "21600"))
+REAPER_INTERVAL = float(os.getenv("REAPER_INTERVAL", "300"))
+REAPER_BATCH_SIZE = int(os.getenv("REAPER_BATCH_SIZE", "500"))
+REAPER_ARCHIVE = os.getenv("REAPER_ARCHIVE", "true").lower() in ("1", "true", "yes")
+
+# Arbitrary key so only one worker reaps a batch at a time on PostgreSQL
+_ADVISORY_LOCK_KEY = 0x72656170
+
+reaper_totals = {"runs": 0, "rooms": 0, "players": 0, "room_cards": 0, "archived": 0}
+metrics.counter("doorsip_reaper_total", "Reaper passes and rows reclaimed since start",
+                lambda: {f'kind="{key}"': value for key, value in reaper_totals.items()})
+
+
+def _archive(db: Session, rooms: List[Room]) -> int:
+    players = db.query(Player).filter(Player.room_id.in_([r.id for r in rooms])).all()
+    by_room: Dict[int, List[Player]] = {}
+    for p in players:
+        by_room.setdefault(p.room_id, []).append(p)
+
+    for room in rooms:
+        db.add(RoomArchive(
+            room_id=room.id,
+            code=room.code,
+            game_id=room.game_id,
+            status=room.status,
+            created_at=room.created_at,
+            ended_at=room.updated_at,
+            leaderboard=[
+                {
+                    "nickname": p.nickname,
+                    "is_host": p.is_host,
+                    "drink_score": p.drink_score,
+                    "action_score": p.action_score
+                }
+                for p in sorted(by_room.get(room.id, []), key=lambda p: p.id)
+            ]
+        ))
+    return len(rooms)
+
+
+def reap_expired_rooms(db: Session) -> Dict[str, int]:
+    """Delete (and optionally archive) expired rooms in bounded batches, one transaction per batch."""
+    reclaimed = {"rooms": 0, "players": 0, "room_cards": 0, "archived": 0}
+    is_postgres = db.get_bind().dialect.name == "postgresql"
+
+    now = datetime.datetime.utcnow()
+    finished_before = now - datetime.timedelta(seconds=ROOM_FINISHED_TTL)
+    idle_before = now - datetime.timedelta(seconds=ROOM_IDLE_TTL)
+
+    while True:
+        if is_postgres:
+            locked = db.execute(
+                text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": _ADVISORY_LOCK_KEY}
+            ).scalar()
+            if not locked:
+                break
+
+        rooms = db.query(Room).filter(or_(
+            (Room.status == GameStatus.FINISHED) & (Room.updated_at < finished_before),
+            Room.updated_at < idle_before
+        )).order_by(Room.id).limit(REAPER_BATCH_SIZE).all()
+        if not rooms:
+            db.rollback()
+            break
+
+        room_ids = [r.id for r in rooms]
+        codes = [r.code for r in rooms]
+        if REAPER_ARCHIVE:
+            reclaimed["archived"] += _archive(db, rooms)
+
+        reclaimed["room_cards"] += db.execute(
+            delete(RoomCard).where(RoomCard.room_id.in_(room_ids))
+        ).rowcount
+        reclaimed["players"] += db.execute(
+            delete(Player).where(Player.room_id.in_(room_ids))
+        ).rowcount
+        reclaimed["rooms"] += db.execute(
+            delete(Room).where(Room.id.in_(room_ids))
+        ).rowcount
+        db.commit()
+        db.expunge_all()
+
+        for code in codes:
+            room_state_cache.invalidate(code)
+            room_changes.forget(code)
+            leaderboard_cache.invalidate(code)
+
+        if len(rooms) < REAPER_BATCH_SIZE:
+            break
+
+    return reclaimed
+
+
+async def run_reaper(interval: float = REAPER_INTERVAL):
+    """Background task started from the app lifespan."""
+    from .routers.websocket import manager
+
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reclaimed = await run_db(reap_expired_rooms)
+            pruned = manager.prune()
+        except Exception:
+            logger.exception("Room reaper pass failed")
+            continue
+
+        reaper_totals["runs"] += 1
+        for key, value in reclaimed.items():
+            reaper_totals[key] += value
+        if reclaimed["rooms"] or pruned:
+            logger.info(
+                "Reaped %d rooms (%d players, %d room cards, %d archived), pruned %d empty socket groups",
+                reclaimed["rooms"], reclaimed["players"], reclaimed["room_cards"],
+                reclaimed["archived"], pruned
+            )
@@ -1,45 +1,39 @@
 from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from sqlalchemy import func
 from typing import List
 
-from ..database import get_db
-from ..models import Game, Card
+from ..admin import require_admin
+from ..catalog import CatalogSnapshot, catalog
+from ..database import run_db
 from ..schemas import GameOut
+from .websocket import manager
 
 router = APIRouter()
 
 
+async def get_catalog() -> CatalogSnapshot:
+    return await catalog.latest()
+
+
 @router.get("/", response_model=List[GameOut])
-def get_games(db: Session = Depends(get_db)):
-    games = db.query(
-        Game.id,
-        Game.name,
-        Game.description,
-        func.count(Card.id).label("cards_count")
-    ).outerjoin(Card).group_by(Game.id).all()
-
-    return [
-        GameOut(
-            id=g.id,
-            name=g.name,
-            description=g.description,
-            cards_count=g.cards_count
-        )
-        for g in games
-    ]
+async def get_games():
+    snapshot = await get_catalog()
+    return list(snapshot.games.values())
+
+
+@router.post("/refresh", dependencies=[Depends(require_admin)])
+async def refresh_catalog():
+    snapshot = await catalog.reload()
+    # Only this worker got the request; the bus reaches the rest
+    await manager.publish_catalog_refresh()
+    return {"games": len(snapshot.games), "cards": len(snapshot.cards)}
 
 
 @router.get("/{game_id}", response_model=GameOut)
-def get_game(game_id: int, db: Session = Depends(get_db)):
-    game = db.query(Game).filter(Game.id == game_id).first()
+async def get_game(game_id: int):
+    snapshot = await get_catalog()
+    game = snapshot.games.get(game_id)
+    if not game:
+        game = await run_db(catalog.get_game, game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
-
-    cards_count = db.query(Card).filter(Card.game_id == game_id).count()
-    return GameOut(
-        id=game.id,
-        name=game.name,
-        description=game.description,
-        cards_count=cards_count
-    )
+    return game
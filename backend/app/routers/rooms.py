@@ -1,21 +1,55 @@
+import asyncio
+import orjson
 import random
+import secrets
 import string
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
-
-from ..database import get_db
-from ..models import Room, Player, Game, Card, RoomCard, GameStatus
+from typing import Dict, Iterable, List, Optional, Set
+
+from ..assets import preload_links
+from ..cache import CachedRoomState, leaderboard_cache, room_changes, room_state_cache
+from ..database import run_db
+from ..encoding import json_response
+from ..catalog import catalog
+from ..models import Room, Player, GameStatus
 from ..schemas import (
     CreateRoomRequest, JoinRoomRequest, RoomOut, PlayerOut,
-    RoomStateOut, CardOut, MakeChoiceRequest, PlayerChoice
+    RoomStateOut, RoomStateDeltaOut, MakeChoiceRequest
 )
+from .. import deck, engine, turns
+from ..engine import room_engine
+from .websocket import manager
 
 router = APIRouter()
 
+ROOM_CODE_ALPHABET = string.ascii_uppercase + string.digits
+ROOM_CODE_LENGTH = 6
+ROOM_CODE_ATTEMPTS = 10
+
 
 def generate_room_code() -> str:
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    return ''.join(secrets.choice(ROOM_CODE_ALPHABET) for _ in range(ROOM_CODE_LENGTH))
+
+
+def insert_room(db: Session, **fields) -> Room:
+    """Insert a room under a fresh random code, retrying on the unique constraint.
+
+    No SELECT per attempt: the unique index on rooms.code is the source of
+    truth, and codes of reaped rooms become available again automatically.
+    """
+    for _ in range(ROOM_CODE_ATTEMPTS):
+        room = Room(code=generate_room_code(), **fields)
+        try:
+            with db.begin_nested():
+                db.add(room)
+        except IntegrityError:
+            continue
+        return room
+    raise HTTPException(status_code=503, detail="Could not allocate a room code, try again")
 
 
 def get_sorted_players(room_id: int, db: Session) -> List[Player]:
@@ -23,22 +57,17 @@ def get_sorted_players(room_id: int, db: Session) -> List[Player]:
     return db.query(Player).filter(Player.room_id == room_id).order_by(Player.id).all()
 
 
-def get_playing_players(room_id: int, db: Session) -> List[Player]:
-    """Get only non-host players sorted by play_order for game turns."""
-    return db.query(Player).filter(
-        Player.room_id == room_id,
-        Player.is_host == False
-    ).order_by(Player.play_order).all()
-
-
-def get_room_out(room: Room, db: Session) -> RoomOut:
-    total_cards = db.query(RoomCard).filter(RoomCard.room_id == room.id).count()
-    players = get_sorted_players(room.id, db)
+def get_room_out(room: Room, db: Session, players: Optional[List[Player]] = None) -> RoomOut:
+    """``players`` are the room's players sorted by id, when the caller already has them."""
+    total_cards = deck.total_cards(db, room)
+    if players is None:
+        players = get_sorted_players(room.id, db)
+    game = catalog.get_game(db, room.game_id)
     return RoomOut(
         id=room.id,
         code=room.code,
         game_id=room.game_id,
-        game_name=room.game.name,
+        game_name=game.name if game else room.game.name,
         status=room.status.value,
         players=[
             PlayerOut(
@@ -51,27 +80,26 @@ def get_room_out(room: Room, db: Session) -> RoomOut:
         ],
         current_player_index=room.current_player_index,
         current_card_index=room.current_card_index,
-        total_cards=total_cards
+        total_cards=total_cards,
+        version=room.version
     )
 
 
-@router.post("/create", response_model=dict)
-def create_room(request: CreateRoomRequest, db: Session = Depends(get_db)):
-    game = db.query(Game).filter(Game.id == request.game_id).first()
-    if not game:
+def _create_room(db: Session, request: CreateRoomRequest):
+    if not catalog.get_game(db, request.game_id):
         raise HTTPException(status_code=404, detail="Game not found")
 
-    cards = db.query(Card).filter(Card.game_id == request.game_id).all()
-    if not cards:
+    card_ids = list(catalog.card_ids(db, request.game_id))
+    if not card_ids:
         raise HTTPException(status_code=400, detail="Game has no cards")
 
-    code = generate_room_code()
-    while db.query(Room).filter(Room.code == code).first():
-        code = generate_room_code()
-
-    room = Room(code=code, game_id=request.game_id, status=GameStatus.WAITING)
-    db.add(room)
-    db.flush()
+    random.shuffle(card_ids)
+    room = insert_room(
+        db,
+        game_id=request.game_id,
+        status=GameStatus.WAITING,
+        deck=deck.pack_deck(card_ids)
+    )
 
     host = Player(
         room_id=room.id,
@@ -79,13 +107,6 @@ def create_room(request: CreateRoomRequest, db: Session = Depends(get_db)):
         is_host=True
     )
     db.add(host)
-
-    shuffled_cards = cards.copy()
-    random.shuffle(shuffled_cards)
-    for idx, card in enumerate(shuffled_cards):
-        room_card = RoomCard(room_id=room.id, card_id=card.id, order_index=idx)
-        db.add(room_card)
-
     db.commit()
     db.refresh(room)
     db.refresh(host)
@@ -97,74 +118,60 @@ def create_room(request: CreateRoomRequest, db: Session = Depends(get_db)):
     }
 
 
-@router.post("/join", response_model=dict)
-def join_room(request: JoinRoomRequest, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == request.room_code.upper()).first()
+def _join_room(db: Session, request: JoinRoomRequest, background_tasks: BackgroundTasks):
+    # Locked like start, so a join can't slip into a game started concurrently
+    room = db.query(Room).filter(Room.code == request.room_code.upper()).with_for_update().first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
     if room.status != GameStatus.WAITING:
         raise HTTPException(status_code=400, detail="Game already started")
 
-    existing = db.query(Player).filter(
-        Player.room_id == room.id,
-        Player.nickname == request.nickname
-    ).first()
-    if existing:
-        raise HTTPException(status_code=400, detail="Nickname already taken")
-
     player = Player(
         room_id=room.id,
         nickname=request.nickname,
         is_host=False
     )
     db.add(player)
-    db.commit()
+    room.version = Room.version + 1
+    try:
+        db.commit()
+    except IntegrityError:
+        # Unique (room_id, nickname) index
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Nickname already taken")
     db.refresh(player)
     db.refresh(room)
 
+    publish_room_state(
+        room, db, background_tasks, "player_joined",
+        changed_player_ids=[player.id], nickname=player.nickname
+    )
+
     return {
         "player_id": player.id,
         "room": get_room_out(room, db)
     }
 
 
-@router.get("/{room_code}", response_model=RoomOut)
-def get_room(room_code: str, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-    return get_room_out(room, db)
-
-
-@router.get("/{room_code}/state", response_model=RoomStateOut)
-def get_room_state(room_code: str, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
-
-    room_out = get_room_out(room, db)
+def build_room_state(room: Room, db: Session, players: Optional[List[Player]] = None) -> RoomStateOut:
+    if players is None:
+        players = get_sorted_players(room.id, db)
+    else:
+        players = sorted(players, key=lambda p: p.id)
+    room_out = get_room_out(room, db, players)
     current_card = None
     current_player = None
 
+    next_cards = []
+
     if room.status == GameStatus.PLAYING:
-        room_card = db.query(RoomCard).filter(
-            RoomCard.room_id == room.id,
-            RoomCard.order_index == room.current_card_index
-        ).first()
-        if room_card:
-            card = room_card.card
-            current_card = CardOut(
-                id=card.id,
-                image_path=card.image_path,
-                card_type=card.card_type.value,
-                drink_points=card.drink_points,
-                action_points=card.action_points
-            )
+        current_card = deck.card_at(db, room, room.current_card_index)
+        next_cards = deck.next_card_images(db, room)
 
-        players = get_playing_players(room.id, db)
-        if players and room.current_player_index < len(players):
-            p = players[room.current_player_index]
+        playing = turns.playing_players(players)
+        if room.current_player_index < len(playing):
+            p = playing[room.current_player_index]
             current_player = PlayerOut(
                 id=p.id,
                 nickname=p.nickname,
@@ -176,13 +183,109 @@ def get_room_state(room_code: str, db: Session = Depends(get_db)):
     return RoomStateOut(
         room=room_out,
         current_card=current_card,
-        current_player=current_player
+        current_player=current_player,
+        next_cards=next_cards
     )
 
 
-@router.post("/{room_code}/start")
-def start_game(room_code: str, player_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
+def store_room_state(state: RoomStateOut) -> CachedRoomState:
+    cached = CachedRoomState(
+        version=state.room.version,
+        payload=state.model_dump_json().encode(),
+        state=state
+    )
+    room_state_cache.set(state.room.code, cached)
+    return cached
+
+
+def cache_room_state(room: Room, db: Session) -> CachedRoomState:
+    return store_room_state(build_room_state(room, db))
+
+
+def publish_state(
+    state: RoomStateOut,
+    background_tasks: BackgroundTasks,
+    event: str,
+    changed_player_ids: Iterable[int] = (),
+    **extra
+):
+    """Encode the fresh room state once, cache it and push it to the room's sockets after the response."""
+    cached = store_room_state(state)
+    room_code = state.room.code
+    room_changes.record(room_code, cached.version, set(changed_player_ids))
+
+    # Splice the already encoded state into the envelope instead of encoding it twice
+    envelope = orjson.dumps({"type": "state_update", "event": event, **extra})
+    message = envelope[:-1] + b',"data":' + cached.payload + b"}"
+    background_tasks.add_task(manager.broadcast_text, room_code, message.decode())
+
+
+def publish_room_state(
+    room: Room,
+    db: Session,
+    background_tasks: BackgroundTasks,
+    event: str,
+    changed_player_ids: Iterable[int] = (),
+    **extra
+):
+    publish_state(build_room_state(room, db), background_tasks, event, changed_player_ids, **extra)
+
+
+def version_etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    tags = [t.strip() for t in header.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def build_state_delta(cached: CachedRoomState, since: int, changed_player_ids: Set[int]) -> RoomStateDeltaOut:
+    state = cached.state
+    return RoomStateDeltaOut(
+        version=cached.version,
+        since=since,
+        status=state.room.status,
+        current_player_index=state.room.current_player_index,
+        current_card_index=state.room.current_card_index,
+        players=[p for p in state.room.players if p.id in changed_player_ids],
+        current_card=state.current_card,
+        current_player=state.current_player,
+        next_cards=state.next_cards
+    )
+
+
+def with_preload(response: Response, state: RoomStateOut) -> Response:
+    if state.next_cards:
+        response.headers["Link"] = preload_links(state.next_cards)
+    return response
+
+
+def _get_room(db: Session, room_code: str, request: Request):
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    etag = version_etag(room.version)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers={"ETag": etag})
+
+    return json_response(get_room_out(room, db).model_dump_json().encode(), etag)
+
+
+def _load_room_state(db: Session, room_code: str) -> CachedRoomState:
+    room = db.query(Room).filter(Room.code == room_code).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return cache_room_state(room, db)
+
+
+def _start_game(db: Session, room_code: str, player_id: int, background_tasks: BackgroundTasks):
+    # Lock first and read the players in later statements, so every committed join gets a play_order
+    room = db.query(Room).filter(Room.code == room_code.upper()).with_for_update().first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
@@ -210,116 +313,239 @@ def start_game(room_code: str, player_id: int, db: Session = Depends(get_db)):
     room.status = GameStatus.PLAYING
     room.current_player_index = 0
     room.current_card_index = 0
+    room.version = Room.version + 1
     db.commit()
 
+    publish_room_state(room, db, background_tasks, "game_started")
+
     return {"status": "started"}
 
 
-@router.post("/{room_code}/choice")
-def make_choice(
+def _make_choice(
+    db: Session,
     room_code: str,
     player_id: int,
     request: MakeChoiceRequest,
-    db: Session = Depends(get_db)
+    background_tasks: BackgroundTasks
 ):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
+    room = turns.lock_room(db, room_code)
+    turns.check_turn(room, player_id)
+    turns.apply_choice(db, room, player_id, request.choice)
+    turns.bump_version(room)
+    # Built from the locked rows before the commit expires them
+    state = build_room_state(room, db, room.players)
+    db.commit()
 
-    if room.status != GameStatus.PLAYING:
-        raise HTTPException(status_code=400, detail="Game not in progress")
+    publish_state(
+        state, background_tasks, "choice_made",
+        changed_player_ids=[player_id], player=player_id, choice=request.choice.value
+    )
 
-    player = db.query(Player).filter(Player.id == player_id).first()
-    if not player or player.room_id != room.id:
-        raise HTTPException(status_code=403, detail="Invalid player")
-
-    players = get_playing_players(room.id, db)
-    current_player = players[room.current_player_index]
-    if current_player.id != player_id:
-        raise HTTPException(status_code=403, detail="Not your turn")
-
-    room_card = db.query(RoomCard).filter(
-        RoomCard.room_id == room.id,
-        RoomCard.order_index == room.current_card_index
-    ).first()
-
-    if not room_card:
-        raise HTTPException(status_code=400, detail="No card available")
-
-    card = room_card.card
-    if request.choice == PlayerChoice.DRINK:
-        player.drink_score += card.drink_points
-    elif request.choice == PlayerChoice.ACTION:
-        player.action_score += card.action_points
-    # SKIP: no points awarded
-
-    room_card.is_used = True
+    return {"status": "choice_made", "choice": request.choice.value}
+
+
+def _next_turn(db: Session, room_code: str, player_id: int, background_tasks: BackgroundTasks):
+    room = turns.lock_room(db, room_code)
+    turns.check_turn(room, player_id)
+    finished = turns.advance_turn(db, room)
+    turns.bump_version(room)
+    state = build_room_state(room, db, room.players)
     db.commit()
 
-    return {"status": "choice_made", "choice": request.choice.value}
+    if finished:
+        publish_state(state, background_tasks, "game_finished")
+        return {"status": "game_finished"}
 
+    publish_state(state, background_tasks, "turn_complete")
 
-@router.post("/{room_code}/next")
-def next_turn(room_code: str, player_id: int, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
+    return {"status": "next_turn"}
+
+
+def _play_turn(
+    db: Session,
+    room_code: str,
+    player_id: int,
+    request: MakeChoiceRequest,
+    background_tasks: BackgroundTasks
+):
+    """Choose and advance in one transaction and one round trip."""
+    room = turns.lock_room(db, room_code)
+    turns.check_turn(room, player_id)
+    turns.apply_choice(db, room, player_id, request.choice)
+    finished = turns.advance_turn(db, room)
+    turns.bump_version(room)
+    state = build_room_state(room, db, room.players)
+    db.commit()
+
+    event = "game_finished" if finished else "turn_complete"
+    publish_state(
+        state, background_tasks, event,
+        changed_player_ids=[player_id], player=player_id, choice=request.choice.value
+    )
+
+    return {"status": "game_finished" if finished else "next_turn", "choice": request.choice.value}
+
+
+def _leaderboard_entries(rows, score_key: str, rank_key: str) -> List[dict]:
+    return [
+        {
+            "id": row.id,
+            "nickname": row.nickname,
+            "score": row[score_key],
+            "rank": row[rank_key],
+            # Everyone tied for first wins, but nobody wins with zero points
+            "is_winner": row[rank_key] == 1 and row[score_key] > 0
+        }
+        for row in sorted(rows, key=lambda r: (r[rank_key], r.id))
+    ]
+
+
+def _get_leaderboard(db: Session, room_code: str) -> bytes:
+    room = db.query(Room.id, Room.status).filter(Room.code == room_code).first()
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
 
-    if room.status != GameStatus.PLAYING:
-        raise HTTPException(status_code=400, detail="Game not in progress")
+    # Both rankings in one pass over the room's players, host excluded
+    rows = db.execute(
+        select(
+            Player.id,
+            Player.nickname,
+            Player.drink_score,
+            Player.action_score,
+            func.rank().over(order_by=Player.drink_score.desc()).label("drink_rank"),
+            func.rank().over(order_by=Player.action_score.desc()).label("action_rank")
+        ).where(Player.room_id == room.id, Player.is_host == False)
+    ).mappings().all()
+
+    payload = orjson.dumps({
+        "drink_leaderboard": _leaderboard_entries(rows, "drink_score", "drink_rank"),
+        "action_leaderboard": _leaderboard_entries(rows, "action_score", "action_rank")
+    })
+    if room.status == GameStatus.FINISHED:
+        leaderboard_cache.set(room_code, payload)
+    return payload
+
+
+async def _run_command(room_code: str, background_tasks: BackgroundTasks, command, *args):
+    """Run a turn command on the room's actor (ROOM_ENGINE=actor) and broadcast the result."""
+    result = await room_engine.execute(room_code, command, *args)
+    publish_state(result.state, background_tasks, result.event, result.changed_player_ids, **result.extra)
+    return result.response
 
-    player = db.query(Player).filter(Player.id == player_id).first()
-    if not player or player.room_id != room.id:
-        raise HTTPException(status_code=403, detail="Invalid player")
 
-    players = get_playing_players(room.id, db)
-    current_player = players[room.current_player_index]
-    if current_player.id != player_id:
-        raise HTTPException(status_code=403, detail="Not your turn")
+@router.post("/create", response_model=dict)
+async def create_room(request: CreateRoomRequest):
+    return await run_db(_create_room, request)
 
-    total_cards = db.query(RoomCard).filter(RoomCard.room_id == room.id).count()
 
-    room.current_card_index += 1
-    if room.current_card_index >= total_cards:
-        room.status = GameStatus.FINISHED
-        db.commit()
-        return {"status": "game_finished"}
+@router.post("/join", response_model=dict)
+async def join_room(request: JoinRoomRequest, background_tasks: BackgroundTasks):
+    if room_engine is None:
+        return await run_db(_join_room, request, background_tasks)
+    # The roster changes under the actor, so write it back and reload it on the next command
+    async with room_engine.detach(request.room_code.upper()):
+        return await run_db(_join_room, request, background_tasks)
 
-    room.current_player_index = (room.current_player_index + 1) % len(players)
-    db.commit()
 
-    return {"status": "next_turn"}
+@router.get("/{room_code}", response_model=RoomOut)
+async def get_room(room_code: str, request: Request):
+    room_code = room_code.upper()
+    cached = room_state_cache.get(room_code)
+    if cached is not None:
+        etag = version_etag(cached.version)
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers={"ETag": etag})
+        return json_response(cached.state.room.model_dump_json().encode(), etag)
+    return await run_db(_get_room, room_code, request)
+
+
+async def current_room_state(room_code: str) -> CachedRoomState:
+    """Latest encoded state from the cache, the room's actor or the DB."""
+    cached = room_state_cache.get(room_code)
+    if cached is None and room_engine is not None:
+        state = room_engine.peek_state(room_code)
+        if state is not None:
+            cached = store_room_state(state)
+    if cached is None:
+        cached = await run_db(_load_room_state, room_code)
+    return cached
 
 
-@router.get("/{room_code}/leaderboard")
-def get_leaderboard(room_code: str, db: Session = Depends(get_db)):
-    room = db.query(Room).filter(Room.code == room_code.upper()).first()
-    if not room:
-        raise HTTPException(status_code=404, detail="Room not found")
+@router.get("/{room_code}/state", response_model=RoomStateOut)
+async def get_room_state(room_code: str, request: Request, since: Optional[int] = None):
+    room_code = room_code.upper()
+    cached = await current_room_state(room_code)
 
-    # Exclude host from leaderboard
-    players = [p for p in room.players if not p.is_host]
+    etag = version_etag(cached.version)
+    if etag_matches(request, etag) or (since is not None and since >= cached.version):
+        return Response(status_code=304, headers={"ETag": etag})
 
-    drink_leaderboard = sorted(players, key=lambda p: p.drink_score, reverse=True)
-    action_leaderboard = sorted(players, key=lambda p: p.action_score, reverse=True)
+    if since is not None:
+        changed = room_changes.changed_since(room_code, since, cached.version)
+        # Fall back to the full snapshot when the change history has rolled over
+        if changed is not None:
+            delta = build_state_delta(cached, since, changed)
+            return with_preload(json_response(delta.model_dump_json().encode(), etag), cached.state)
 
-    return {
-        "drink_leaderboard": [
-            {
-                "id": p.id,
-                "nickname": p.nickname,
-                "score": p.drink_score,
-                "is_winner": i == 0 and p.drink_score > 0
-            }
-            for i, p in enumerate(drink_leaderboard)
-        ],
-        "action_leaderboard": [
-            {
-                "id": p.id,
-                "nickname": p.nickname,
-                "score": p.action_score,
-                "is_winner": i == 0 and p.action_score > 0
-            }
-            for i, p in enumerate(action_leaderboard)
-        ]
-    }
+    return with_preload(json_response(cached.payload, etag), cached.state)
+
+
+@router.post("/{room_code}/start")
+async def start_game(room_code: str, player_id: int, background_tasks: BackgroundTasks):
+    if room_engine is not None:
+        return await _run_command(room_code, background_tasks, engine.start_command, player_id)
+    return await run_db(_start_game, room_code, player_id, background_tasks)
+
+
+@router.post("/{room_code}/choice")
+async def make_choice(
+    room_code: str,
+    player_id: int,
+    request: MakeChoiceRequest,
+    background_tasks: BackgroundTasks
+):
+    if room_engine is not None:
+        return await _run_command(room_code, background_tasks, engine.choice_command, player_id, request.choice)
+    return await run_db(_make_choice, room_code, player_id, request, background_tasks)
+
+
+@router.post("/{room_code}/next")
+async def next_turn(room_code: str, player_id: int, background_tasks: BackgroundTasks):
+    if room_engine is not None:
+        return await _run_command(room_code, background_tasks, engine.next_command, player_id)
+    return await run_db(_next_turn, room_code, player_id, background_tasks)
+
+
+@router.post("/{room_code}/turn")
+async def play_turn(
+    room_code: str,
+    player_id: int,
+    request: MakeChoiceRequest,
+    background_tasks: BackgroundTasks
+):
+    if room_engine is not None:
+        return await _run_command(room_code, background_tasks, engine.turn_command, player_id, request.choice)
+    return await run_db(_play_turn, room_code, player_id, request, background_tasks)
+
+
+_leaderboard_pending: Dict[str, "asyncio.Future[bytes]"] = {}
+
+
+async def _load_leaderboard(room_code: str) -> bytes:
+    if room_engine is not None:
+        await room_engine.flush_room(room_code)
+    return await run_db(_get_leaderboard, room_code)
+
+
+@router.get("/{room_code}/leaderboard")
+async def get_leaderboard(room_code: str):
+    room_code = room_code.upper()
+    payload = leaderboard_cache.get(room_code)
+    if payload is None:
+        # Coalesce the end-of-game stampede into one query per room
+        pending = _leaderboard_pending.get(room_code)
+        if pending is None:
+            pending = _leaderboard_pending[room_code] = asyncio.ensure_future(_load_leaderboard(room_code))
+            pending.add_done_callback(lambda _: _leaderboard_pending.pop(room_code, None))
+        payload = await asyncio.shield(pending)
+    return json_response(payload)
@@ -1,82 +1,372 @@
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import Dict, List
-import json
+from collections import deque
+from fastapi import APIRouter, BackgroundTasks, HTTPException, WebSocket, WebSocketDisconnect
+from typing import Deque, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+import uuid
+
+from .. import metrics
+from ..cache import room_state_cache
+from ..catalog import catalog
+from ..encoding import dumps, loads
+from ..pubsub import PubSubBackend, create_pubsub_backend
+from ..schemas import MakeChoiceRequest
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+WS_SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "32"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+WS_PING_INTERVAL = float(os.getenv("WS_PING_INTERVAL", "20"))
+# A socket that sends nothing (not even a pong) for this long is treated as half-open
+WS_PING_TIMEOUT = float(os.getenv("WS_PING_TIMEOUT", "60"))
+WS_REPLAY_BUFFER = int(os.getenv("WS_REPLAY_BUFFER", "64"))
+# How long a room's replay buffer outlives its last socket, to cover a whole room reconnecting
+WS_REPLAY_TTL = float(os.getenv("WS_REPLAY_TTL", "600"))
+
+# Bus topic for control messages; never clashes with a 6-character room code
+CATALOG_TOPIC = "*catalog"
+
+PING = dumps({"type": "ping"})
+INVALID_COMMAND = dumps({"type": "ack", "ok": False, "status": 400, "detail": "Invalid command"})
+
+
+def is_state_update(data: str) -> bool:
+    # Envelopes are built compact with "type" first, so only the head needs a look
+    return '"type":"state_update"' in data[:32]
+
+
+class RoomHistory:
+    """Sequence counter and ring buffer of the latest broadcasts of one room."""
+
+    def __init__(self, size: int):
+        self.seq = 0
+        self.messages: Deque[Tuple[int, str]] = deque(maxlen=size)
+        self.updated_at = time.monotonic()
+
+    def append(self, data: str) -> str:
+        self.seq += 1
+        self.updated_at = time.monotonic()
+        data = f'{data[:-1]},"seq":{self.seq}}}'
+        self.messages.append((self.seq, data))
+        return data
+
+    def since(self, seq: int) -> Optional[List[str]]:
+        """Messages after ``seq``, or None when some of them already rolled out of the buffer."""
+        if seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.messages or self.messages[0][0] > seq + 1:
+            return None
+        return [data for message_seq, data in self.messages if message_seq > seq]
+
+
+class ClientConnection:
+    """One socket with a bounded outbound queue drained by its own writer task.
+
+    A slow client only delays itself: when its queue is full the oldest
+    pending state snapshot is dropped (a newer one supersedes it), and a
+    send that takes longer than WS_SEND_TIMEOUT gets the socket closed.
+    """
+
+    def __init__(self, websocket: WebSocket, room_code: str, manager: "ConnectionManager"):
+        self.websocket = websocket
+        self.room_code = room_code
+        self.manager = manager
+        # (message, time it was queued)
+        self.queue: Deque[Tuple[str, float]] = deque()
+        self.wakeup = asyncio.Event()
+        self.closed = False
+        self.last_seen = time.monotonic()
+        self.writer = asyncio.create_task(self._write_loop())
+
+    def enqueue(self, data: str):
+        if self.closed:
+            return
+        if len(self.queue) >= WS_SEND_QUEUE_SIZE:
+            self._drop_one()
+        self.queue.append((data, time.perf_counter()))
+        self.wakeup.set()
+
+    def _drop_one(self):
+        for i, (pending, _) in enumerate(self.queue):
+            if is_state_update(pending):
+                del self.queue[i]
+                break
+        else:
+            self.queue.popleft()
+        self.manager.dropped_messages += 1
+
+    async def _write_loop(self):
+        while not self.closed:
+            if not self.queue:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+            data, queued_at = self.queue.popleft()
+            try:
+                await asyncio.wait_for(self.websocket.send_text(data), WS_SEND_TIMEOUT)
+                metrics.ws_send_latency.observe(
+                    "state_update" if is_state_update(data) else "event", time.perf_counter() - queued_at
+                )
+            except asyncio.TimeoutError:
+                logger.info("Closing slow WebSocket client in room %s", self.room_code)
+                await self._abort()
+                return
+            except (WebSocketDisconnect, RuntimeError, OSError):
+                await self._abort()
+                return
+
+    async def _abort(self, code: int = 1011):
+        self.manager.disconnect(self.websocket, self.room_code)
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), 1)
+        except Exception:
+            pass
+
+    def close(self):
+        self.closed = True
+        self.queue.clear()
+        if self.writer is not asyncio.current_task():
+            self.writer.cancel()
+
 
 class ConnectionManager:
-    def __init__(self):
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+    def __init__(self, backend: Optional[PubSubBackend] = None):
+        self.active_connections: Dict[str, Dict[WebSocket, ClientConnection]] = {}
+        self.history: Dict[str, RoomHistory] = {}
+        self.dropped_messages = 0
+        self.evicted_connections = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.backend = backend if backend is not None else create_pubsub_backend()
+        # Identifies this manager on the bus so it skips its own messages
+        self.node_id = uuid.uuid4().hex
+
+    async def start(self):
+        await self.backend.subscribe(self._on_bus_message)
+        self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+
+    async def stop(self):
+        if self._heartbeat is not None:
+            self._heartbeat.cancel()
+        await self.backend.unsubscribe(self._on_bus_message)
+        await self.backend.close()
 
-    async def connect(self, websocket: WebSocket, room_code: str):
+    async def connect(
+        self,
+        websocket: WebSocket,
+        room_code: str,
+        last_seq: Optional[int] = None,
+        epoch: Optional[str] = None
+    ) -> ClientConnection:
+        """Accept the socket and, for a client resuming with ``last_seq``, queue what it missed.
+
+        Missed broadcasts are replayed from the room's buffer when it still holds
+        all of them; otherwise (buffer rolled over, or the client was connected to
+        another worker or before a restart) the client gets a fresh state snapshot.
+        """
         await websocket.accept()
-        if room_code not in self.active_connections:
-            self.active_connections[room_code] = []
-        self.active_connections[room_code].append(websocket)
+        history = self.history.get(room_code)
+        seq = history.seq if history is not None else 0
+        replay: Optional[List[str]] = None
+        snapshot = None
+        if last_seq is not None:
+            if epoch == self.node_id:
+                replay = history.since(last_seq) if history is not None else ([] if last_seq == 0 else None)
+            if replay is None:
+                snapshot = await self._snapshot(room_code, seq)
+                history = self.history.get(room_code)
+                # The snapshot already covers state updates broadcast while it loaded
+                replay = [m for m in (history.since(seq) or []) if not is_state_update(m)] if history else []
+
+        connection = ClientConnection(websocket, room_code, self)
+        self.active_connections.setdefault(room_code, {})[websocket] = connection
+        # Nothing awaited since the buffer was read, so no broadcast can slip in between
+        current = self.history[room_code].seq if room_code in self.history else 0
+        connection.enqueue(dumps({"type": "hello", "seq": current, "epoch": self.node_id}))
+        if snapshot is not None:
+            connection.enqueue(snapshot)
+        for data in replay or ():
+            connection.enqueue(data)
+        return connection
+
+    async def _snapshot(self, room_code: str, seq: int) -> Optional[str]:
+        from .rooms import current_room_state
+
+        try:
+            cached = await current_room_state(room_code)
+        except HTTPException:
+            return None
+        return f'{{"type":"state_update","event":"snapshot","data":{cached.payload.decode()},"seq":{seq}}}'
 
     def disconnect(self, websocket: WebSocket, room_code: str):
         if room_code in self.active_connections:
-            if websocket in self.active_connections[room_code]:
-                self.active_connections[room_code].remove(websocket)
+            connection = self.active_connections[room_code].pop(websocket, None)
+            if connection is not None:
+                connection.close()
             if not self.active_connections[room_code]:
                 del self.active_connections[room_code]
 
+    def prune(self) -> int:
+        """Drop room entries left without sockets and expired replay buffers.
+
+        Returns how many socket groups were removed.
+        """
+        empty = [code for code, connections in self.active_connections.items() if not connections]
+        for code in empty:
+            del self.active_connections[code]
+        cutoff = time.monotonic() - WS_REPLAY_TTL
+        for code in [c for c, h in self.history.items() if h.updated_at < cutoff and c not in self.active_connections]:
+            del self.history[code]
+        return len(empty)
+
+    async def _heartbeat_loop(self):
+        """Ping every socket and close the ones that stopped answering."""
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL)
+            silent_since = time.monotonic() - WS_PING_TIMEOUT
+            silent = []
+            for connections in list(self.active_connections.values()):
+                for connection in list(connections.values()):
+                    if connection.last_seen < silent_since:
+                        silent.append(connection)
+                    else:
+                        connection.enqueue(PING)
+            if silent:
+                self.evicted_connections += len(silent)
+                logger.info("Closing %d silent WebSocket clients", len(silent))
+                await asyncio.gather(*(connection._abort(code=1001) for connection in silent))
+
     async def broadcast(self, room_code: str, message: dict):
-        if room_code in self.active_connections:
-            dead_connections = []
-            for connection in self.active_connections[room_code]:
-                try:
-                    await connection.send_text(json.dumps(message))
-                except:
-                    dead_connections.append(connection)
-            for conn in dead_connections:
-                self.disconnect(conn, room_code)
+        await self.broadcast_text(room_code, dumps(message))
+
+    async def broadcast_text(self, room_code: str, data: str):
+        """Send an already encoded message to the room on this node and publish it to the others."""
+        await self.send_local(room_code, data)
+        try:
+            await self.backend.publish(self.node_id, room_code, data)
+        except Exception:
+            logger.exception("Failed to publish broadcast for room %s", room_code)
+
+    async def publish_catalog_refresh(self):
+        """Tell the other workers to reload their card catalog, as this one just did."""
+        try:
+            await self.backend.publish(self.node_id, CATALOG_TOPIC, "")
+        except Exception:
+            logger.exception("Failed to publish a catalog refresh")
+
+    async def _on_bus_message(self, origin: str, room_code: str, data: str):
+        if origin == self.node_id:
+            return
+        if room_code == CATALOG_TOPIC:
+            try:
+                await catalog.reload()
+            except Exception:
+                logger.exception("Catalog reload requested by another worker failed")
+            return
+        # Another node changed this room, so our cached state is stale
+        room_state_cache.invalidate(room_code)
+        await self.send_local(room_code, data)
+
+    async def send_local(self, room_code: str, data: str):
+        """Number the message, keep it for replay and queue it on every socket of the room.
+
+        Each writer task then sends it concurrently.
+        """
+        history = self.history.get(room_code)
+        if history is None:
+            history = self.history[room_code] = RoomHistory(WS_REPLAY_BUFFER)
+        data = history.append(data)
+        for connection in list(self.active_connections.get(room_code, {}).values()):
+            connection.enqueue(data)
 
 
 manager = ConnectionManager()
 
+metrics.gauge("doorsip_ws_connections", "Open WebSocket connections on this node",
+              lambda: sum(len(c) for c in manager.active_connections.values()))
+metrics.gauge("doorsip_ws_rooms", "Rooms with at least one open WebSocket on this node",
+              lambda: len(manager.active_connections))
+metrics.gauge("doorsip_ws_queued_messages", "Messages waiting in socket send queues",
+              lambda: sum(len(conn.queue) for c in manager.active_connections.values() for conn in c.values()))
+metrics.counter("doorsip_ws_evicted_connections_total", "Sockets closed for missing pings",
+                lambda: manager.evicted_connections)
+metrics.counter("doorsip_ws_dropped_messages_total", "Messages dropped from full socket send queues",
+                lambda: manager.dropped_messages)
+
+
+async def run_command(connection: ClientConnection, room_code: str, message: dict):
+    """Run a typed command through the same handlers as the REST routes and ack it.
+
+    The ack goes only to the sender, ahead of the state_update the command
+    broadcasts to the whole room.
+    """
+    from .rooms import make_choice, next_turn, play_turn, start_game
+
+    command = message.get("type")
+    ack = {"type": "ack", "id": message.get("id"), "command": command}
+    tasks = BackgroundTasks()
+    try:
+        # Type first, so an unknown command is reported as such whatever else it carries
+        if command not in ("start", "next", "choose", "turn"):
+            raise HTTPException(status_code=400, detail="Unknown command")
+        player_id = int(message["player_id"])
+        if command == "start":
+            result = await start_game(room_code, player_id, tasks)
+        elif command == "next":
+            result = await next_turn(room_code, player_id, tasks)
+        elif command == "choose":
+            result = await make_choice(room_code, player_id, MakeChoiceRequest(choice=message.get("choice")), tasks)
+        else:
+            result = await play_turn(room_code, player_id, MakeChoiceRequest(choice=message.get("choice")), tasks)
+    except HTTPException as exc:
+        ack.update(ok=False, status=exc.status_code, detail=exc.detail)
+    except (KeyError, TypeError, ValueError):
+        # Missing or malformed player_id / choice (pydantic errors are ValueErrors)
+        ack.update(ok=False, status=400, detail="Invalid command")
+    except Exception:
+        logger.exception("WebSocket command %s failed in room %s", command, room_code)
+        ack.update(ok=False, status=500, detail="Internal error")
+    else:
+        ack.update(ok=True, result=result)
+    connection.enqueue(dumps(ack))
+    await tasks()
+
 
 @router.websocket("/{room_code}")
-async def websocket_endpoint(websocket: WebSocket, room_code: str):
+async def websocket_endpoint(
+    websocket: WebSocket,
+    room_code: str,
+    last_seq: Optional[int] = None,
+    epoch: Optional[str] = None
+):
     room_code = room_code.upper()
-    await manager.connect(websocket, room_code)
+    connection = await manager.connect(websocket, room_code, last_seq, epoch)
     try:
         while True:
             data = await websocket.receive_text()
-            message = json.loads(data)
-
-            if message.get("type") == "update":
-                await manager.broadcast(room_code, {
-                    "type": "state_update",
-                    "data": message.get("data", {})
-                })
-            elif message.get("type") == "player_joined":
-                await manager.broadcast(room_code, {
-                    "type": "player_joined",
-                    "nickname": message.get("nickname")
-                })
-            elif message.get("type") == "game_started":
-                await manager.broadcast(room_code, {
-                    "type": "game_started"
-                })
-            elif message.get("type") == "choice_made":
-                await manager.broadcast(room_code, {
-                    "type": "choice_made",
-                    "player": message.get("player"),
-                    "choice": message.get("choice")
-                })
-            elif message.get("type") == "turn_complete":
-                await manager.broadcast(room_code, {
-                    "type": "turn_complete"
-                })
-            elif message.get("type") == "game_finished":
-                await manager.broadcast(room_code, {
-                    "type": "game_finished"
-                })
+            # Any frame proves the client is alive, a pong needs no further handling
+            connection.last_seen = time.monotonic()
+            try:
+                message = loads(data)
+            except ValueError:
+                message = None
+            if not isinstance(message, dict):
+                connection.enqueue(INVALID_COMMAND)
+                continue
+
+            if message.get("type") != "pong":
+                await run_command(connection, room_code, message)
 
     except WebSocketDisconnect:
         manager.disconnect(websocket, room_code)
         await manager.broadcast(room_code, {
             "type": "player_disconnected"
         })
+    finally:
+        # Also covers errors that end the loop
+        manager.disconnect(websocket, room_code)
@@ -25,6 +25,19 @@ class GameOut(GameBase):
 
     class Config:
         from_attributes = True
+        frozen = True
+
+
+class CardVariantOut(BaseModel):
+    name: str  # thumb / mobile / full
+    format: str  # avif / webp
+    path: str  # relative to /cards, like image_path
+    width: int
+    height: int
+    bytes: int
+
+    class Config:
+        frozen = True
 
 
 class CardOut(BaseModel):
@@ -33,9 +46,21 @@ class CardOut(BaseModel):
     card_type: CardType
     drink_points: int
     action_points: int
+    # Resized/re-encoded copies from scripts/compress_cards.py, empty if none were built
+    variants: List[CardVariantOut] = []
 
     class Config:
         from_attributes = True
+        frozen = True
+
+
+class CardImageOut(BaseModel):
+    """Just what a client needs to prefetch a card's image."""
+    image_path: str
+    variants: List[CardVariantOut] = []
+
+    class Config:
+        frozen = True
 
 
 class PlayerBase(BaseModel):
@@ -72,6 +97,7 @@ class RoomOut(BaseModel):
     current_player_index: int
     current_card_index: int
     total_cards: int
+    version: int = 0
 
     class Config:
         from_attributes = True
@@ -81,6 +107,19 @@ class RoomStateOut(BaseModel):
     room: RoomOut
     current_card: Optional[CardOut] = None
     current_player: Optional[PlayerOut] = None
+    next_cards: List[CardImageOut] = []  # Images of the next CARD_PREFETCH_COUNT cards
+
+
+class RoomStateDeltaOut(BaseModel):
+    version: int
+    since: int
+    status: GameStatus
+    current_player_index: int
+    current_card_index: int
+    players: List[PlayerOut]  # Only players changed since the given version
+    current_card: Optional[CardOut] = None
+    current_player: Optional[PlayerOut] = None
+    next_cards: List[CardImageOut] = []
 
 
 class PlayerChoice(str, Enum):
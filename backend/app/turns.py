@@ -0,0 +1,105 @@
+"""Transactional turn engine shared by the room endpoints.
+
+Every function expects to run inside one DB transaction that starts with
+lock_room() and ends with bump_version(), so a double tap or a choice racing a "next" is serialized on
+the room row instead of double-awarding points or skipping a card.
+lock_room() brings the room's players along, so a turn reads the database
+once and only writes after that.
+"""
+from typing import List, Optional
+
+from fastapi import HTTPException
+from sqlalchemy import update
+from sqlalchemy.orm import Session, joinedload
+
+from . import deck
+from .models import Room, Player, GameStatus
+from .schemas import PlayerChoice
+
+
+def lock_room(db: Session, room_code: str) -> Room:
+    """Load the room and its players with SELECT ... FOR UPDATE (a no-op on SQLite).
+
+    Only the room row is locked; every write to the players goes through it.
+    """
+    room = db.query(Room).options(joinedload(Room.players)).filter(
+        Room.code == room_code.upper()
+    ).with_for_update(of=Room).one_or_none()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    return room
+
+
+def playing_players(players: List[Player]) -> List[Player]:
+    """Non-host players in turn order."""
+    # Same order as ORDER BY play_order: anyone without one (never expected once started) goes last
+    return sorted(
+        (p for p in players if not p.is_host),
+        key=lambda p: (p.play_order is None, p.play_order or 0, p.id)
+    )
+
+
+def current_player_id(room: Room) -> Optional[int]:
+    players = playing_players(room.players)
+    if room.current_player_index < len(players):
+        return players[room.current_player_index].id
+    return None
+
+
+def check_turn(room: Room, player_id: int):
+    if room.status != GameStatus.PLAYING:
+        raise HTTPException(status_code=400, detail="Game not in progress")
+
+    if current_player_id(room) != player_id:
+        if not any(p.id == player_id for p in room.players):
+            raise HTTPException(status_code=403, detail="Invalid player")
+        raise HTTPException(status_code=403, detail="Not your turn")
+
+
+def bump_version(room: Room):
+    """One version per transaction, however many steps it ran, so ?since= deltas see every version."""
+    # The row is locked, so the loaded version is current and the new one needs no re-read
+    room.version += 1
+
+
+def apply_choice(db: Session, room: Room, player_id: int, choice: PlayerChoice):
+    """Award the current card's points to the player in a single UPDATE.
+
+    The UPDATE also brings the already loaded Player in the session up to date,
+    so the new state is built without reading the players again.
+    """
+    current = deck.card_at(db, room, room.current_card_index)
+    if not current:
+        raise HTTPException(status_code=400, detail="No card available")
+    if room.chosen_card_index == room.current_card_index:
+        raise HTTPException(status_code=400, detail="Choice already made")
+
+    if choice == PlayerChoice.DRINK:
+        db.execute(
+            update(Player)
+            .where(Player.id == player_id)
+            .values(drink_score=Player.drink_score + current.drink_points)
+        )
+    elif choice == PlayerChoice.ACTION:
+        db.execute(
+            update(Player)
+            .where(Player.id == player_id)
+            .values(action_score=Player.action_score + current.action_points)
+        )
+    # SKIP: no points awarded
+
+    room.chosen_card_index = room.current_card_index
+
+
+def advance_turn(db: Session, room: Room) -> bool:
+    """Move to the next card and player. Returns True when the deck is exhausted."""
+    total_cards = deck.total_cards(db, room)
+    players_count = len(playing_players(room.players))
+
+    room.current_card_index += 1
+    if room.current_card_index >= total_cards:
+        room.status = GameStatus.FINISHED
+        return True
+
+    room.current_player_index = (room.current_player_index + 1) % players_count
+    return False
@@ -0,0 +1,12 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Make the app package importable however pytest is started
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# A throwaway SQLite database unless the run points somewhere else; read when app.database is imported
+_tmp_dir = tempfile.mkdtemp(prefix="doorsip-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{_tmp_dir}/test.db")
+os.environ.setdefault("CARDS_PATH", _tmp_dir)
@@ -0,0 +1,114 @@
+import asyncio
+
+from app.cache import CachedRoomState, room_state_cache
+from app.catalog import catalog
+from app.encoding import dumps, loads
+from app.pubsub import MAX_NOTIFY_PAYLOAD, InProcessPubSub, PostgresPubSub
+from app.routers.websocket import ConnectionManager
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.sent.append(data)
+
+    async def close(self, code: int = 1000):
+        pass
+
+
+def broadcasts(websocket: FakeWebSocket):
+    # Skip the hello every new socket gets
+    return [data for data in websocket.sent if '"type":"hello"' not in data]
+
+
+def test_two_managers_share_the_bus():
+    async def scenario():
+        bus = InProcessPubSub()
+        origin = ConnectionManager(bus)
+        receiver = ConnectionManager(bus)
+        await origin.start()
+        await receiver.start()
+
+        origin_socket = FakeWebSocket()
+        receiver_socket = FakeWebSocket()
+        await origin.connect(origin_socket, "ROOM01")
+        await receiver.connect(receiver_socket, "ROOM01")
+        room_state_cache.set("ROOM01", CachedRoomState(version=1, payload=b"{}", state=None))
+
+        await origin.broadcast_text("ROOM01", '{"type":"state_update","data":{}}')
+        # Let the writer tasks drain their queues
+        await asyncio.sleep(0.05)
+
+        origin.disconnect(origin_socket, "ROOM01")
+        receiver.disconnect(receiver_socket, "ROOM01")
+        await origin.stop()
+        await receiver.stop()
+        return origin_socket, receiver_socket
+
+    origin_socket, receiver_socket = asyncio.run(scenario())
+
+    # Delivered once on each node: locally by the origin, via the bus by the receiver
+    assert len(broadcasts(origin_socket)) == 1
+    assert len(broadcasts(receiver_socket)) == 1
+    assert '"type":"state_update"' in broadcasts(receiver_socket)[0]
+    # The receiver dropped its cached state, another node changed the room
+    assert room_state_cache.get("ROOM01") is None
+
+
+def test_catalog_refresh_reaches_the_other_managers(monkeypatch):
+    reloads = []
+
+    async def reload():
+        reloads.append(True)
+
+    monkeypatch.setattr(catalog, "reload", reload)
+
+    async def scenario():
+        bus = InProcessPubSub()
+        origin = ConnectionManager(bus)
+        receiver = ConnectionManager(bus)
+        await origin.start()
+        await receiver.start()
+        await origin.publish_catalog_refresh()
+        await origin.stop()
+        await receiver.stop()
+
+    asyncio.run(scenario())
+
+    # The origin already reloaded before publishing; only the receiver reacts
+    assert reloads == [True]
+
+
+def test_postgres_bus_skips_malformed_and_trims_oversized_payloads():
+    received = []
+    sent = []
+
+    async def handler(origin, room_code, data):
+        received.append((origin, room_code, data))
+
+    class FakePool:
+        async def execute(self, query, channel, payload):
+            sent.append(payload)
+
+    async def scenario():
+        bus = PostgresPubSub("postgresql://unused")
+        bus.handlers.append(handler)
+        for payload in ("not json", "[1]", '{"origin": "a"}', dumps({"origin": "a", "room": "ROOM01", "data": "{}"})):
+            bus._on_notify(None, 0, bus.channel, payload)
+        await asyncio.sleep(0)
+
+        bus._pool = FakePool()
+        envelope = {"type": "state_update", "event": "player_joined", "nickname": "bob"}
+        await bus.publish("a", "ROOM01", dumps({**envelope, "data": {"blob": "x" * MAX_NOTIFY_PAYLOAD}}))
+        return envelope
+
+    envelope = asyncio.run(scenario())
+
+    assert received == [("a", "ROOM01", "{}")]
+    # The state is dropped, the event and nickname for the toast are kept
+    assert loads(loads(sent[0])["data"]) == envelope
@@ -0,0 +1,78 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from app.cache import room_state_cache
+from app.catalog import catalog
+from app.database import SessionLocal
+from app.main import app
+from app.models import Card, Game, Player, Room
+
+pytestmark = pytest.mark.skipif(SessionLocal is None, reason="needs a sync DATABASE_URL")
+
+
+@pytest.fixture
+def client():
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def game_id(client):
+    with SessionLocal() as db:
+        game = Game(name="Turns", description="")
+        db.add(game)
+        db.flush()
+        for i in range(4):
+            db.add(Card(game_id=game.id, image_path=f"turns/{i}.webp", drink_points=i + 1, action_points=1))
+        db.commit()
+        game_id = game.id
+    client.portal.call(catalog.reload)
+    return game_id
+
+
+def start_room(client, game_id, *nicknames):
+    created = client.post("/api/rooms/create", json={"game_id": game_id, "host_nickname": "host"}).json()
+    code = created["room_code"]
+    for nickname in nicknames:
+        assert client.post("/api/rooms/join", json={"room_code": code, "nickname": nickname}).status_code == 200
+    assert client.post(f"/api/rooms/{code}/start", params={"player_id": created["player_id"]}).status_code == 200
+    return code
+
+
+def test_player_without_play_order_does_not_break_the_room(client, game_id):
+    code = start_room(client, game_id, "a", "b")
+    # What a join committed behind a concurrent start used to leave behind
+    with SessionLocal() as db:
+        room = db.query(Room).filter(Room.code == code).one()
+        db.add(Player(room_id=room.id, nickname="late", is_host=False))
+        db.commit()
+    room_state_cache.invalidate(code)
+
+    state = client.get(f"/api/rooms/{code}/state")
+    assert state.status_code == 200
+    current = state.json()["current_player"]
+    assert current["nickname"] != "late"
+
+    response = client.post(f"/api/rooms/{code}/next", params={"player_id": current["id"]})
+    assert response.status_code == 200
+    assert client.get(f"/api/rooms/{code}/state").status_code == 200
+
+
+def test_join_after_start_is_rejected(client, game_id):
+    code = start_room(client, game_id, "a")
+    response = client.post("/api/rooms/join", json={"room_code": code, "nickname": "late"})
+    assert response.status_code == 400
+
+
+def test_combined_turn_bumps_the_version_once(client, game_id):
+    code = start_room(client, game_id, "a")
+    state = client.get(f"/api/rooms/{code}/state").json()
+    version, player_id = state["room"]["version"], state["current_player"]["id"]
+
+    response = client.post(f"/api/rooms/{code}/turn", params={"player_id": player_id}, json={"choice": "drink"})
+    assert response.status_code == 200
+
+    # A delta, not the full snapshot the client gets when a version is missing from the change log
+    delta = client.get(f"/api/rooms/{code}/state", params={"since": version}).json()
+    assert delta["version"] == version + 1
+    assert delta["since"] == version
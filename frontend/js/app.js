@@ -7,11 +7,57 @@ let state = {
     isHost: false,
     selectedGameId: null,
     ws: null,
+    wsSeq: null,
+    wsEpoch: null,
+    wsRetries: 0,
+    roomVersion: null,
     choiceMade: false,
     currentCardType: null,
-    cardFlipped: false
+    cardFlipped: false,
+    renderedTurn: null
 };
 
+// 1x1 AVIF; if it decodes, the browser can show AVIF card variants
+const AVIF_PROBE = 'data:image/avif;base64,AAAAIGZ0eXBhdmlmAAAAAGF2aWZtaWYxbWlhZk1BMUIAAADrbWV0YQAAAAAAAAAhaGRscgAAAAAAAAAAcGljdAAAAAAAAAAAAAAAAAAAAAAOcGl0bQAAAAAAAQAAAB5pbG9jAAAAAEQAAAEAAQAAAAEAAAETAAAAIQAAAChpaW5mAAAAAAABAAAAGmluZmUCAAAAAAEAAGF2MDFDb2xvcgAAAABqaXBycAAAAEtpcGNvAAAAFGlzcGUAAAAAAAAAAQAAAAEAAAAQcGl4aQAAAAADCAgIAAAADGF2MUOBAAwAAAAAE2NvbHJuY2x4AAEADQAGgAAAABdpcG1hAAAAAAAAAAEAAQQBAoMEAAAAKW1kYXQSAAoIGAAGiAhoNCAyExlHh4Yhh5555oAAAJBAyRxgimo=';
+let supportsAvif = false;
+(() => {
+    const probe = new Image();
+    probe.onload = () => { supportsAvif = probe.width > 0; };
+    probe.src = AVIF_PROBE;
+})();
+
+// Smallest card variant that still fills the card on this screen
+function cardImageUrl(card) {
+    const formats = supportsAvif ? ['avif', 'webp'] : ['webp'];
+    const variants = (card.variants || []).filter(v => formats.includes(v.format));
+    if (!variants.length) {
+        return `/cards/${card.image_path}`;
+    }
+
+    const cardWidth = document.getElementById('card-front').clientWidth || window.innerWidth;
+    const needed = cardWidth * (window.devicePixelRatio || 1);
+    // Variants come sorted by width, then bytes, so the first wide enough one is the lightest
+    const fit = variants.find(v => v.width >= needed) || variants[variants.length - 1];
+    const sameWidth = variants.filter(v => v.width === fit.width);
+    const best = sameWidth.find(v => v.format === formats[0]) || fit;
+    return `/cards/${best.path}`;
+}
+
+// Warm the browser cache with the next cards so a new turn does not wait on the network
+const prefetchedImages = new Set();
+function prefetchCards(cards) {
+    (cards || []).forEach(card => {
+        const url = cardImageUrl(card);
+        if (prefetchedImages.has(url)) {
+            return;
+        }
+        prefetchedImages.add(url);
+        const img = new Image();
+        img.decoding = 'async';
+        img.src = url;
+    });
+}
+
 // Screen management
 function showScreen(screenId) {
     document.querySelectorAll('.screen').forEach(s => s.classList.remove('active'));
@@ -96,6 +142,7 @@ async function createRoom() {
         const data = await response.json();
         state.playerId = data.player_id;
         state.roomCode = data.room_code;
+        state.roomVersion = data.room.version;
         state.isHost = true;
 
         updateLobby(data.room);
@@ -140,18 +187,14 @@ async function joinRoom() {
         const data = await response.json();
         state.playerId = data.player_id;
         state.roomCode = roomCode;
+        state.roomVersion = data.room.version;
         state.isHost = false;
 
         updateLobby(data.room);
         showScreen('lobby');
 
-        // Connect and notify others after connection is established
-        connectWebSocket(() => {
-            state.ws.send(JSON.stringify({
-                type: 'player_joined',
-                nickname: nickname
-            }));
-        });
+        // The server announces the join to everyone in the room
+        connectWebSocket();
     } catch (error) {
         showToast('Ошибка входа в комнату', true);
         console.error(error);
@@ -178,23 +221,57 @@ function updateLobby(room) {
 // WebSocket connection
 function connectWebSocket(onConnected = null) {
     if (state.ws) {
-        state.ws.close();
+        const old = state.ws;
+        state.ws = null;
+        old.close();
     }
 
-    state.ws = new WebSocket(`${WS_URL}/${state.roomCode}`);
+    // After a drop, ask the server to replay only what we missed
+    const resume = state.wsEpoch && state.wsSeq !== null
+        ? `?last_seq=${state.wsSeq}&epoch=${state.wsEpoch}`
+        : '';
+    const socket = new WebSocket(`${WS_URL}/${state.roomCode}${resume}`);
+    state.ws = socket;
 
-    state.ws.onopen = () => {
+    socket.onopen = () => {
         console.log('WebSocket connected');
+        state.wsRetries = 0;
         if (onConnected) onConnected();
     };
 
-    state.ws.onmessage = async (event) => {
+    socket.onmessage = async (event) => {
         const message = JSON.parse(event.data);
+        if (message.type === 'ping') {
+            socket.send('{"type":"pong"}');
+            return;
+        }
+        if (message.type === 'hello') {
+            if (message.epoch !== state.wsEpoch) {
+                state.wsEpoch = message.epoch;
+                state.wsSeq = message.seq;
+            }
+            return;
+        }
+        if (message.type === 'ack') {
+            settleCommand(message);
+            return;
+        }
+        if (message.seq !== undefined) {
+            state.wsSeq = message.seq;
+        }
         handleWebSocketMessage(message);
     };
 
-    state.ws.onclose = () => {
+    socket.onclose = () => {
         console.log('WebSocket disconnected');
+        // Closed on purpose (left the room or replaced by a new socket)
+        if (state.ws !== socket || !state.roomCode) return;
+        // Back off with jitter so a whole room does not reconnect in the same instant
+        const delay = Math.min(1000 * 2 ** state.wsRetries, 10000) * (0.5 + Math.random() / 2);
+        state.wsRetries += 1;
+        setTimeout(() => {
+            if (state.ws === socket) connectWebSocket();
+        }, delay);
     };
 
     state.ws.onerror = (error) => {
@@ -202,6 +279,93 @@ function connectWebSocket(onConnected = null) {
     };
 }
 
+function isWsOpen() {
+    return state.ws && state.ws.readyState === WebSocket.OPEN;
+}
+
+// Commands over the open socket; the ack comes back with the same id
+let commandId = 0;
+const pendingCommands = new Map();
+
+function sendCommand(type, payload = {}) {
+    return new Promise((resolve, reject) => {
+        const id = ++commandId;
+        const timer = setTimeout(() => {
+            pendingCommands.delete(id);
+            reject(new Error(`No ack for ${type}`));
+        }, 10000);
+        pendingCommands.set(id, { resolve, timer });
+        state.ws.send(JSON.stringify({ type, id, player_id: state.playerId, ...payload }));
+    });
+}
+
+function settleCommand(ack) {
+    const pending = pendingCommands.get(ack.id);
+    if (!pending) return;
+    pendingCommands.delete(ack.id);
+    clearTimeout(pending.timer);
+    pending.resolve(ack);
+}
+
+// Run a room action over the socket when it is open, otherwise over HTTP.
+// Resolves to { ok, data, detail } either way.
+async function roomCommand(command, path, body = null) {
+    if (isWsOpen()) {
+        const ack = await sendCommand(command, body || {});
+        return { ok: ack.ok, data: ack.result, detail: ack.detail };
+    }
+    const options = { method: 'POST' };
+    if (body) {
+        options.headers = { 'Content-Type': 'application/json' };
+        options.body = JSON.stringify(body);
+    }
+    const response = await fetch(`${API_URL}/rooms/${state.roomCode}/${path}?player_id=${state.playerId}`, options);
+    const data = await response.json();
+    return { ok: response.ok, data, detail: data.detail };
+}
+
+// Pushes go out from per-request background tasks, so an older state can arrive after a newer one
+function isNewerState(room) {
+    if (state.roomVersion !== null && room.version <= state.roomVersion) return false;
+    state.roomVersion = room.version;
+    return true;
+}
+
+// Apply a room state pushed by the server (no extra HTTP round-trip)
+async function applyRoomState(message) {
+    let data = message.data;
+    if (!data || !data.room) {
+        // Too big to relay between workers: only the event came through, fetch the state itself
+        data = await fetchRoomState();
+        if (!data) return;
+    }
+
+    switch (message.event) {
+        case 'player_joined':
+            showToast(`${message.nickname} присоединился!`);
+            break;
+        case 'game_started':
+            showToast('Игра началась!');
+            break;
+    }
+
+    // A late push still gets its toast, but not its stale state
+    if (!isNewerState(data.room)) return;
+
+    if (data.room.status === 'waiting') {
+        updateLobby(data.room);
+    } else if (data.room.status === 'finished') {
+        if (!document.getElementById('results-screen').classList.contains('active')) {
+            showResults();
+        }
+    } else {
+        if (!document.getElementById('game-screen').classList.contains('active')) {
+            showScreen('game-screen');
+        }
+        updateGameUI(data);
+    }
+}
+
 function handleWebSocketMessage(message) {
     switch (message.type) {
         case 'player_joined':
@@ -222,7 +386,7 @@ function handleWebSocketMessage(message) {
             showResults();
             break;
         case 'state_update':
-            refreshGameState();
+            applyRoomState(message);
             break;
         case 'player_disconnected':
             showToast('Игрок отключился');
@@ -246,21 +410,18 @@ async function refreshRoom() {
 // Start game
 async function startGame() {
     try {
-        const response = await fetch(`${API_URL}/rooms/${state.roomCode}/start?player_id=${state.playerId}`, {
-            method: 'POST'
-        });
+        const usedWs = isWsOpen();
+        const result = await roomCommand('start', 'start');
 
-        if (!response.ok) {
-            const error = await response.json();
-            showToast(error.detail || 'Ошибка запуска игры', true);
+        if (!result.ok) {
+            showToast(result.detail || 'Ошибка запуска игры', true);
             return;
         }
 
-        if (state.ws && state.ws.readyState === WebSocket.OPEN) {
-            state.ws.send(JSON.stringify({ type: 'game_started' }));
+        // Connected clients receive the new state from the server
+        if (!usedWs) {
+            startGameScreen();
         }
-
-        startGameScreen();
     } catch (error) {
         showToast('Ошибка запуска игры', true);
         console.error(error);
@@ -272,12 +433,20 @@ async function startGameScreen() {
     await refreshGameState();
 }
 
-async function refreshGameState() {
+async function fetchRoomState() {
     try {
         const response = await fetch(`${API_URL}/rooms/${state.roomCode}/state`);
-        if (!response.ok) return;
+        return response.ok ? await response.json() : null;
+    } catch (error) {
+        console.error('Error fetching room state:', error);
+        return null;
+    }
+}
 
-        const data = await response.json();
+async function refreshGameState() {
+    try {
+        const data = await fetchRoomState();
+        if (!data || !isNewerState(data.room)) return;
 
         if (data.room.status === 'finished') {
             showResults();
@@ -299,8 +468,17 @@ function updateGameUI(data) {
     document.getElementById('total-cards').textContent = room.total_cards;
     document.getElementById('current-player-name').textContent = currentPlayer ? currentPlayer.nickname : '';
 
+    prefetchCards(data.next_cards);
+
+    // The same turn is pushed again after a choice; keep the chooser's buttons as they are
+    const turnKey = `${room.current_card_index}:${currentPlayer ? currentPlayer.id : ''}`;
+    if (state.renderedTurn === turnKey) {
+        return;
+    }
+    state.renderedTurn = turnKey;
+
     if (card) {
-        const cardImageUrl = `/cards/${card.image_path}`;
+        const imageUrl = cardImageUrl(card);
         const loader = document.getElementById('card-loader');
 
         // Show loader
@@ -309,14 +487,14 @@ function updateGameUI(data) {
         // Preload image
         const img = new Image();
         img.onload = () => {
-            document.getElementById('card-front').style.backgroundImage = `url('${cardImageUrl}')`;
-            document.getElementById('card-back').style.backgroundImage = `url('${cardImageUrl}')`;
+            document.getElementById('card-front').style.backgroundImage = `url('${imageUrl}')`;
+            document.getElementById('card-back').style.backgroundImage = `url('${imageUrl}')`;
             loader.classList.remove('loading');
         };
         img.onerror = () => {
             loader.classList.remove('loading');
         };
-        img.src = cardImageUrl;
+        img.src = imageUrl;
 
         state.currentCardType = card.card_type;
 
@@ -349,15 +527,10 @@ function updateGameUI(data) {
 
 async function makeChoice(choice) {
     try {
-        const response = await fetch(`${API_URL}/rooms/${state.roomCode}/choice?player_id=${state.playerId}`, {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ choice: choice })
-        });
+        const result = await roomCommand('choose', 'choice', { choice: choice });
 
-        if (!response.ok) {
-            const error = await response.json();
-            showToast(error.detail || 'Ошибка', true);
+        if (!result.ok) {
+            showToast(result.detail || 'Ошибка', true);
             return;
         }
 
@@ -377,14 +550,6 @@ async function makeChoice(choice) {
             choiceText = 'СДЕЛАЙ!';
         }
         document.getElementById('choice-made-text').textContent = `Твой выбор: ${choiceText}`;
-
-        if (state.ws && state.ws.readyState === WebSocket.OPEN) {
-            state.ws.send(JSON.stringify({
-                type: 'choice_made',
-                player: state.playerId,
-                choice: choice
-            }));
-        }
     } catch (error) {
         showToast('Ошибка выбора', true);
         console.error(error);
@@ -393,27 +558,18 @@ async function makeChoice(choice) {
 
 async function confirmReady() {
     try {
-        const response = await fetch(`${API_URL}/rooms/${state.roomCode}/next?player_id=${state.playerId}`, {
-            method: 'POST'
-        });
+        const usedWs = isWsOpen();
+        const result = await roomCommand('next', 'next');
 
-        if (!response.ok) {
-            const error = await response.json();
-            showToast(error.detail || 'Ошибка', true);
+        if (!result.ok) {
+            showToast(result.detail || 'Ошибка', true);
             return;
         }
 
-        const data = await response.json();
-
-        if (data.status === 'game_finished') {
-            if (state.ws && state.ws.readyState === WebSocket.OPEN) {
-                state.ws.send(JSON.stringify({ type: 'game_finished' }));
-            }
+        // With an open socket the server pushes the next state to everyone
+        if (result.data.status === 'game_finished') {
             showResults();
-        } else {
-            if (state.ws && state.ws.readyState === WebSocket.OPEN) {
-                state.ws.send(JSON.stringify({ type: 'turn_complete' }));
-            }
+        } else if (!usedWs) {
             await refreshGameState();
         }
     } catch (error) {
@@ -474,20 +630,20 @@ async function showResults() {
 
         const data = await response.json();
 
-        document.getElementById('final-drink-leaderboard').innerHTML = data.drink_leaderboard.map((p, i) => `
+        document.getElementById('final-drink-leaderboard').innerHTML = data.drink_leaderboard.map(p => `
             <li class="${p.is_winner ? 'winner' : ''}">
                 <div class="player-info">
-                    <span class="rank">${i + 1}</span>
+                    <span class="rank">${p.rank}</span>
                     <span>${p.nickname}</span>
                 </div>
                 <span class="score">${p.score}</span>
             </li>
         `).join('');
 
-        document.getElementById('final-action-leaderboard').innerHTML = data.action_leaderboard.map((p, i) => `
+        document.getElementById('final-action-leaderboard').innerHTML = data.action_leaderboard.map(p => `
             <li class="${p.is_winner ? 'winner' : ''}">
                 <div class="player-info">
-                    <span class="rank">${i + 1}</span>
+                    <span class="rank">${p.rank}</span>
                     <span>${p.nickname}</span>
                 </div>
                 <span class="score">${p.score}</span>
@@ -509,9 +665,14 @@ function backToMenu() {
         isHost: false,
         selectedGameId: null,
         ws: null,
+        wsSeq: null,
+        wsEpoch: null,
+        wsRetries: 0,
+        roomVersion: null,
         choiceMade: false,
         currentCardType: null,
-        cardFlipped: false
+        cardFlipped: false,
+        renderedTurn: null
     };
     showScreen('main-menu');
 }
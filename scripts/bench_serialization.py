@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Микробенчмарк сериализации ответов бэкенда:
+1. /state и /{room_code}: response_model (валидация + jsonable_encoder + JSONResponse)
+   против json_response с готовыми байтами из кэша / model_dump_json
+2. /leaderboard: jsonable_encoder + JSONResponse против orjson + json_response
+3. WebSocket: json.dumps всего сообщения против вклейки готового состояния
+
+Запуск: python scripts/bench_serialization.py [--players 8] [--number 20000]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent / 'backend'))
+
+try:
+    import orjson
+    from fastapi.encoders import jsonable_encoder
+    from fastapi.responses import JSONResponse
+    from fastapi.routing import serialize_response
+    from fastapi.utils import create_response_field
+except ImportError:
+    print("Установите зависимости бэкенда: pip install -r backend/requirements.txt")
+    sys.exit(1)
+
+from app.encoding import json_response
+from app.schemas import CardOut, PlayerOut, RoomOut, RoomStateOut
+
+
+def build_state(players_count: int) -> RoomStateOut:
+    players = [
+        PlayerOut(id=i, nickname=f"player{i}", is_host=i == 1, drink_score=i * 3, action_score=i * 2)
+        for i in range(1, players_count + 1)
+    ]
+    return RoomStateOut(
+        room=RoomOut(
+            id=1,
+            code="ABC123",
+            game_id=1,
+            game_name="mygame",
+            status="playing",
+            players=players,
+            current_player_index=1,
+            current_card_index=7,
+            total_cards=60,
+            version=42
+        ),
+        current_card=CardOut(id=8, image_path="mygame/8.webp", card_type="do_or_drink", drink_points=2, action_points=3),
+        current_player=players[1]
+    )
+
+
+def build_leaderboard(players_count: int) -> dict:
+    return {
+        key: [
+            {"id": i, "nickname": f"player{i}", "score": players_count - i, "rank": i + 1, "is_winner": i == 0}
+            for i in range(players_count)
+        ]
+        for key in ("drink_leaderboard", "action_leaderboard")
+    }
+
+
+def bench(label: str, fn, number: int) -> float:
+    per_call = min(timeit.repeat(fn, number=number, repeat=3)) / number * 1e6
+    print(f"  {label:<44} {per_call:8.2f} мкс")
+    return per_call
+
+
+def bench_response_model(label: str, field, value, number: int) -> float:
+    """То, что FastAPI делает с response_model: валидация, jsonable_encoder, затем JSONResponse."""
+    async def run() -> float:
+        best = float("inf")
+        for _ in range(3):
+            start = time.perf_counter()
+            for _ in range(number):
+                JSONResponse(await serialize_response(field=field, response_content=value))
+            best = min(best, time.perf_counter() - start)
+        return best
+
+    per_call = asyncio.run(run()) / number * 1e6
+    print(f"  {label:<44} {per_call:8.2f} мкс")
+    return per_call
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Стоимость сериализации ответа на один запрос")
+    parser.add_argument('--players', type=int, default=8)
+    parser.add_argument('--number', type=int, default=20000)
+    args = parser.parse_args()
+
+    state = build_state(args.players)
+    payload = state.model_dump_json().encode()
+    leaderboard = build_leaderboard(args.players)
+    etag = f'"{state.room.version}"'
+    state_field = create_response_field(name="state", type_=RoomStateOut)
+    room_field = create_response_field(name="room", type_=RoomOut)
+
+    print(f"Игроков в комнате: {args.players}")
+
+    print("\n/state")
+    before = bench_response_model("до: response_model", state_field, state, args.number)
+    after = bench("после: json_response из кэша", lambda: json_response(payload, etag), args.number)
+    bench(
+        "после, промах кэша: model_dump_json",
+        lambda: json_response(state.model_dump_json().encode(), etag),
+        args.number
+    )
+    print(f"  ускорение: x{before / after:.1f}")
+
+    print("\n/{room_code}")
+    before = bench_response_model("до: response_model", room_field, state.room, args.number)
+    after = bench(
+        "после: model_dump_json + json_response",
+        lambda: json_response(state.room.model_dump_json().encode(), etag),
+        args.number
+    )
+    print(f"  ускорение: x{before / after:.1f}")
+
+    print("\n/leaderboard")
+    before = bench(
+        "до: jsonable_encoder + JSONResponse",
+        lambda: JSONResponse(jsonable_encoder(leaderboard)),
+        args.number
+    )
+    after = bench("после: orjson + json_response", lambda: json_response(orjson.dumps(leaderboard)), args.number)
+    print(f"  ускорение: x{before / after:.1f}")
+
+    print("\nWebSocket state_update")
+    extra = {"type": "state_update", "event": "choice_made", "player": 2, "choice": "drink"}
+    before = bench(
+        "до: json.dumps(model_dump())",
+        lambda: json.dumps({**extra, "data": state.model_dump(mode="json")}),
+        args.number
+    )
+
+    def splice():
+        envelope = orjson.dumps(extra)
+        return (envelope[:-1] + b',"data":' + payload + b"}").decode()
+
+    after = bench("после: orjson + вклейка готового состояния", splice, args.number)
+    print(f"  ускорение: x{before / after:.1f}")
+
+
+if __name__ == '__main__':
+    main()
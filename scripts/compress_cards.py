@@ -4,15 +4,31 @@
 1. Масштабирует к стандартному размеру
 2. Удаляет прозрачный разделитель
 3. Уменьшает разрешение в 2 раза
-4. Конвертирует в WebP для лучшего сжатия
+4. Конвертирует в WebP (и AVIF, если Pillow его поддерживает) в нескольких
+   ширинах: thumb, mobile и full
+5. Пишет card_manifest.json: image_path -> варианты с размерами и весом,
+   бэкенд отдаёт его в CardOut.variants
+
+Карточки обрабатываются параллельно (ProcessPoolExecutor). Уже сжатые
+файлы пропускаются по манифесту: сначала сверяются размер и mtime
+исходника, при расхождении — его sha256.
+
+Пример:
+    python scripts/compress_cards.py data/cards/mygame data/cards/mygame_webp --glob '*.png' --workers 8
 """
 
+import argparse
+import hashlib
+import io
+import json
 import os
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 
 try:
-    from PIL import Image
+    from PIL import Image, features
 except ImportError:
     print("Установите Pillow: pip install Pillow")
     sys.exit(1)
@@ -33,12 +49,40 @@ FINAL_HEIGHT = int(STANDARD_HEIGHT * SCALE_FACTOR)  # 712
 
 # WebP качество
 WEBP_QUALITY = 85
+# method=6 сжимает на пару процентов лучше, но в несколько раз медленнее
+WEBP_METHOD = 4
+# AVIF при том же визуальном качестве заметно меньше WebP
+AVIF_QUALITY = 60
+AVIF_SPEED = 6
+
+# Ширины вариантов; full — это исходный FINAL_WIDTH
+VARIANT_WIDTHS = {
+    'thumb': 240,
+    'mobile': 640,
+    'full': FINAL_WIDTH,
+}
+FORMATS = ('avif', 'webp')
+
+MANIFEST_NAME = '.compress_manifest.json'
+# Длина префикса sha256 в именах вариантов; backend/app/assets.py ищет ровно столько hex-символов
+HASH_LENGTH = 12
+CARD_MANIFEST_NAME = 'card_manifest.json'
+STAGES = ('load', 'transform', 'encode')
 
 
-def process_card(input_path: Path, output_path: Path) -> dict:
+def process_card(
+    input_path: Path,
+    output_path: Path,
+    quality: int = WEBP_QUALITY,
+    method: int = WEBP_METHOD,
+    formats: tuple = ('webp',)
+) -> dict:
+    started = time.perf_counter()
     img = Image.open(input_path)
+    img.load()
     original_size = os.path.getsize(input_path)
     orig_width, orig_height = img.size
+    loaded = time.perf_counter()
 
     # Масштабируем к стандартному размеру
     if orig_width != STANDARD_WIDTH or orig_height != STANDARD_HEIGHT:
@@ -66,61 +110,305 @@ def process_card(input_path: Path, output_path: Path) -> dict:
         background = Image.new('RGB', result.size, (255, 255, 255))
         background.paste(result, mask=result.split()[3])
         result = background
+    transformed = time.perf_counter()
 
-    # Сохраняем как WebP
+    # Каждый вариант получает имя с хэшем содержимого: такие URL никогда не меняют
+    # содержимое, и бэкенд отдаёт их с Cache-Control: immutable
     output_path.parent.mkdir(parents=True, exist_ok=True)
-    result.save(output_path, 'WEBP', quality=WEBP_QUALITY, method=6)
+    variants = []
+    for name, width in VARIANT_WIDTHS.items():
+        if width >= result.size[0]:
+            image = result
+        else:
+            image = result.resize((width, round(result.size[1] * width / result.size[0])), Image.Resampling.LANCZOS)
+        for fmt in formats:
+            buffer = io.BytesIO()
+            if fmt == 'webp':
+                image.save(buffer, 'WEBP', quality=quality, method=method)
+            else:
+                image.save(buffer, 'AVIF', quality=AVIF_QUALITY, speed=AVIF_SPEED)
+            data = buffer.getvalue()
+            path = variant_path(output_path, name, fmt, hashlib.sha256(data).hexdigest()[:HASH_LENGTH])
+            write_atomic(path, data)
+            if name == 'full' and fmt == 'webp':
+                # Прежнее имя <stem>.webp, на него могут ссылаться image_path в БД
+                write_atomic(output_path, data)
+            variants.append({
+                'name': name,
+                'format': fmt,
+                'file': path.name,
+                'width': image.size[0],
+                'height': image.size[1],
+                'bytes': len(data),
+            })
+    encoded = time.perf_counter()
 
     new_size = os.path.getsize(output_path)
 
     return {
         'original_size': original_size,
         'new_size': new_size,
+        'variants_size': sum(v['bytes'] for v in variants),
         'original_dimensions': (orig_width, orig_height),
         'new_dimensions': result.size,
+        'variants': variants,
+        'timings': {
+            'load': loaded - started,
+            'transform': transformed - loaded,
+            'encode': encoded - transformed,
+        },
     }
 
 
+def variant_path(output_path: Path, name: str, fmt: str, digest: str) -> Path:
+    """<stem>.<hash>.<fmt> для full, <stem>-<name>.<hash>.<fmt> для остальных."""
+    suffix = '' if name == 'full' else f'-{name}'
+    return output_path.with_name(f"{output_path.stem}{suffix}.{digest}.{fmt}")
+
+
+def write_atomic(path: Path, data: bytes):
+    # Через временный файл, чтобы прерванный запуск не оставил битую картинку
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def file_sha256(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_manifest(path: Path) -> dict:
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(path: Path, manifest: dict):
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def is_up_to_date(entry: dict, source: Path, output: Path, settings: dict) -> tuple:
+    """Возвращает (актуален ли файл, sha256 исходника или None, если не считали)."""
+    if not entry or entry.get('settings') != settings or not output.exists():
+        return False, None
+    stat = source.stat()
+    if entry.get('size') == stat.st_size and entry.get('mtime_ns') == stat.st_mtime_ns:
+        return True, entry.get('sha256')
+    # mtime мог поменяться от копирования или git checkout — сверяем содержимое
+    sha256 = file_sha256(source)
+    return sha256 == entry.get('sha256'), sha256
+
+
+def parse_args():
+    default_input = Path(__file__).parent.parent / 'data' / 'cards' / 'mygame'
+    parser = argparse.ArgumentParser(description="Параллельное инкрементальное сжатие карточек в WebP")
+    parser.add_argument('input_dir', nargs='?', type=Path, default=default_input,
+                        help="Папка с исходными карточками (по умолчанию data/cards/mygame)")
+    parser.add_argument('output_dir', nargs='?', type=Path, default=None,
+                        help="Куда писать WebP (по умолчанию <input_dir>_webp)")
+    parser.add_argument('--glob', default='*.png', help="Шаблон исходных файлов, можно '**/*.png'")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Число процессов")
+    parser.add_argument('--quality', type=int, default=WEBP_QUALITY)
+    parser.add_argument('--method', type=int, default=WEBP_METHOD, choices=range(7), help="WebP method 0-6")
+    parser.add_argument('--formats', default=','.join(FORMATS),
+                        help="Форматы через запятую: webp, avif (AVIF пропускается, если Pillow его не умеет)")
+    parser.add_argument('--cards-root', type=Path, default=None,
+                        help="Корень CARDS_PATH, от него считаются пути в card_manifest.json "
+                             "(по умолчанию родитель input_dir)")
+    parser.add_argument('--force', action='store_true', help="Пересжать всё, игнорируя манифест")
+    return parser.parse_args()
+
+
+def parse_formats(value: str) -> tuple:
+    formats = [f.strip().lower() for f in value.split(',') if f.strip()]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        print(f"Неизвестные форматы: {', '.join(sorted(unknown))}")
+        sys.exit(1)
+    if 'avif' in formats and not features.check('avif'):
+        print("Pillow собран без AVIF, пишем только WebP")
+        formats.remove('avif')
+    if 'webp' not in formats:
+        # full WebP — это image_path по умолчанию, без него старые клиенты останутся без картинок
+        formats.append('webp')
+    return tuple(formats)
+
+
+def build_card_manifest(manifest: dict, sources: list, cards_dir: Path, output_dir: Path, cards_root: Path) -> dict:
+    """image_path (исходник и full WebP, оба относительно cards_root) -> список вариантов."""
+    cards = {}
+    for rel in sources:
+        entry = manifest.get(rel)
+        if not entry or 'variants' not in entry:
+            continue
+        variants = [
+            {
+                'name': v['name'],
+                'format': v['format'],
+                'path': (output_dir / Path(rel).parent / v['file']).relative_to(cards_root).as_posix(),
+                'width': v['width'],
+                'height': v['height'],
+                'bytes': v['bytes'],
+            }
+            for v in entry['variants']
+        ]
+        # image_path в БД может указывать на исходник, на <stem>.webp или на хэшированный full WebP
+        keys = [cards_dir / rel, output_dir / entry['output']]
+        keys += [output_dir / Path(rel).parent / v['file'] for v in entry['variants']
+                 if v['name'] == 'full' and v['format'] == 'webp']
+        for key in keys:
+            cards[key.relative_to(cards_root).as_posix()] = variants
+    return {'version': 1, 'cards': cards}
+
+
 def main():
-    cards_dir = Path(__file__).parent.parent / 'data' / 'cards' / 'mygame'
-    output_dir = cards_dir.parent / 'mygame_webp'
+    args = parse_args()
+    cards_dir = args.input_dir
+    output_dir = args.output_dir or cards_dir.parent / (cards_dir.name + '_webp')
+    cards_root = (args.cards_root or cards_dir.parent).resolve()
+    cards_dir = cards_dir.resolve()
+    output_dir = output_dir.resolve()
+    formats = parse_formats(args.formats)
+    settings = {
+        'quality': args.quality,
+        'method': args.method,
+        'avif_quality': AVIF_QUALITY,
+        'widths': VARIANT_WIDTHS,
+        'formats': list(formats),
+        'hash_length': HASH_LENGTH,
+    }
 
     if not cards_dir.exists():
         print(f"Папка не найдена: {cards_dir}")
         sys.exit(1)
+    for path in (cards_dir, output_dir):
+        # /cards раздаёт только cards_root, пути в манифесте считаются от него
+        if not path.is_relative_to(cards_root):
+            print(f"{path} вне --cards-root {cards_root}")
+            sys.exit(1)
 
-    png_files = list(cards_dir.glob('*.png'))
+    timings = {}
+    started = time.perf_counter()
+    png_files = sorted(p for p in cards_dir.glob(args.glob) if p.is_file() and p.suffix != '.tmp')
+    timings['scan'] = time.perf_counter() - started
     if not png_files:
-        print("PNG файлы не найдены")
+        print(f"Файлы {args.glob} не найдены")
         sys.exit(1)
 
-    print(f"Найдено {len(png_files)} карточек")
-    print(f"Целевой размер: {FINAL_WIDTH}x{FINAL_HEIGHT}")
+    manifest_path = output_dir / MANIFEST_NAME
+    manifest = {} if args.force else load_manifest(manifest_path)
+
+    started = time.perf_counter()
+    jobs = []
+    hashes = {}
+    for png_file in png_files:
+        rel = png_file.relative_to(cards_dir).as_posix()
+        output_file = output_dir / Path(rel).with_suffix('.webp')
+        fresh, sha256 = is_up_to_date(manifest.get(rel), png_file, output_file, settings)
+        if fresh:
+            # Обновляем mtime в манифесте, чтобы в следующий раз не хэшировать
+            stat = png_file.stat()
+            manifest[rel].update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+            continue
+        hashes[rel] = sha256
+        jobs.append((rel, png_file, output_file))
+    timings['check'] = time.perf_counter() - started
+
+    print(f"Найдено {len(png_files)} карточек, к обработке {len(jobs)}, актуальны {len(png_files) - len(jobs)}")
+    print(f"Целевой размер: {FINAL_WIDTH}x{FINAL_HEIGHT}, WebP quality={args.quality} method={args.method}")
+    print(f"Варианты: {', '.join(f'{n} {w}px' for n, w in VARIANT_WIDTHS.items())}; форматы: {', '.join(formats)}")
     print("-" * 50)
 
     total_original = 0
     total_new = 0
+    total_variants = 0
+    failed = 0
+    stage_totals = dict.fromkeys(STAGES, 0.0)
 
-    for png_file in sorted(png_files):
-        output_file = output_dir / (png_file.stem + '.webp')
+    started = time.perf_counter()
+    if jobs:
+        workers = max(1, min(args.workers, len(jobs)))
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(process_card, png_file, output_file, args.quality, args.method, formats):
+                    (rel, png_file, output_file)
+                for rel, png_file, output_file in jobs
+            }
+            for future in as_completed(futures):
+                rel, png_file, output_file = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"Ошибка {rel}: {e}")
+                    continue
 
-        try:
-            result = process_card(png_file, output_file)
-            total_original += result['original_size']
-            total_new += result['new_size']
+                total_original += result['original_size']
+                total_new += result['new_size']
+                total_variants += result['variants_size']
+                for stage in STAGES:
+                    stage_totals[stage] += result['timings'][stage]
 
-            orig_kb = result['original_size'] / 1024
-            new_kb = result['new_size'] / 1024
+                # Старые хэшированные файлы этой карточки больше никто не отдаёт
+                kept = {v['file'] for v in result['variants']}
+                for old in manifest.get(rel, {}).get('variants', []):
+                    if old['file'] not in kept:
+                        (output_file.parent / old['file']).unlink(missing_ok=True)
 
-            print(f"{png_file.name} -> {output_file.name}:")
-            print(f"  {result['original_dimensions']} -> {result['new_dimensions']}")
-            print(f"  {orig_kb:.0f} KB -> {new_kb:.0f} KB")
-        except Exception as e:
-            print(f"Ошибка {png_file.name}: {e}")
+                stat = png_file.stat()
+                manifest[rel] = {
+                    'size': stat.st_size,
+                    'mtime_ns': stat.st_mtime_ns,
+                    'sha256': hashes[rel] or file_sha256(png_file),
+                    'output': output_file.relative_to(output_dir).as_posix(),
+                    'output_size': result['new_size'],
+                    'variants': result['variants'],
+                    'settings': settings,
+                }
 
+                orig_kb = result['original_size'] / 1024
+                new_kb = result['new_size'] / 1024
+                smallest_kb = min(v['bytes'] for v in result['variants']) / 1024
+                print(f"{rel} -> {output_file.name}: {result['original_dimensions']} -> "
+                      f"{result['new_dimensions']}, {orig_kb:.0f} KB -> {new_kb:.0f} KB "
+                      f"(вариантов {len(result['variants'])}, самый лёгкий {smallest_kb:.0f} KB)")
+    timings['process'] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    output_dir.mkdir(parents=True, exist_ok=True)
+    save_manifest(manifest_path, manifest)
+    sources = [p.relative_to(cards_dir).as_posix() for p in png_files]
+    save_manifest(
+        output_dir / CARD_MANIFEST_NAME,
+        build_card_manifest(manifest, sources, cards_dir, output_dir, cards_root)
+    )
+    timings['manifest'] = time.perf_counter() - started
+
+    processed = len(jobs) - failed
     print("-" * 50)
-    print(f"Итого: {total_original / (1024*1024):.1f} MB -> {total_new / (1024*1024):.1f} MB")
-    print(f"Сжатие: {total_original / total_new:.1f}x")
+    if processed:
+        wall = timings['process']
+        print(f"Итого: {total_original / (1024*1024):.1f} MB -> {total_new / (1024*1024):.1f} MB")
+        print(f"Сжатие: {total_original / total_new:.1f}x")
+        print(f"Все варианты вместе: {total_variants / (1024*1024):.1f} MB")
+        print(f"Скорость: {processed / wall:.1f} карточек/с, {total_original / (1024*1024) / wall:.1f} MB/с")
+        print("Этапы в процессах (сумма CPU по воркерам): " + ", ".join(
+            f"{stage} {stage_totals[stage]:.2f} с" for stage in STAGES
+        ))
+    print("Этапы: " + ", ".join(f"{name} {seconds:.2f} с" for name, seconds in timings.items()))
+    if failed:
+        print(f"Ошибок: {failed}")
+        sys.exit(1)
 
 
 if __name__ == '__main__':
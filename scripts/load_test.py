@@ -0,0 +1,389 @@
+#!/usr/bin/env python3
+"""
+Нагрузочный тест: симуляция вечеринок против настоящего API и WebSocket.
+
+N комнат × M игроков проходят полный сценарий:
+create -> join -> подключение WebSocket у всех -> start -> повторяющиеся
+choice/next текущего игрока, пока колода не кончится (или --turns ходов).
+После каждого запроса ждём, пока state_update с новой версией дойдёт до
+всех сокетов комнаты.
+
+По умолчанию бэкенд поднимается прямо в этом процессе (uvicorn в отдельном
+потоке) на временной SQLite; --database-url позволяет взять локальный
+Postgres, --url — уже запущенный сервер (тогда без подсчёта запросов к БД).
+
+Отчёт: p50/p95/p99 по каждому эндпоинту, ходов в секунду, задержка доставки
+broadcast (от начала запроса до получения сообщения сокетом), запросов к БД
+на ход. Результат пишется в JSON для сравнения версий.
+
+Пример:
+    python scripts/load_test.py --rooms 50 --players 6 --cards 30 --output results.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent / 'backend'
+sys.path.insert(0, str(BACKEND_DIR))
+
+try:
+    import httpx
+    import websockets
+except ImportError:
+    print("Установите зависимости: pip install -r backend/requirements.txt httpx")
+    sys.exit(1)
+
+LOAD_GAME_NAME = 'Load test'
+WAIT_TIMEOUT = 15.0
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)  # endpoint -> seconds
+        self.errors = defaultdict(int)
+        self.broadcast_lag = []
+        self.turns = 0
+
+    def summary(self) -> dict:
+        return {
+            'endpoints': {name: summarize(values, self.errors.get(name, 0)) for name, values in sorted(self.latencies.items())},
+            'broadcast_lag': summarize(self.broadcast_lag),
+        }
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: list, errors: int = 0) -> dict:
+    if not values:
+        return {'count': 0, 'errors': errors}
+    return {
+        'count': len(values),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(values) * 1000, 3),
+        'p50_ms': round(percentile(values, 50) * 1000, 3),
+        'p95_ms': round(percentile(values, 95) * 1000, 3),
+        'p99_ms': round(percentile(values, 99) * 1000, 3),
+        'max_ms': round(max(values) * 1000, 3),
+    }
+
+
+class Reader:
+    """Читает сокет одного игрока и помнит, когда пришла каждая версия комнаты."""
+
+    def __init__(self, ws):
+        self.ws = ws
+        self.version = -1
+        self.state = None
+        self.received = {}  # version -> время получения
+        self.changed = asyncio.Condition()
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            async for raw in self.ws:
+                message = json.loads(raw)
+                if message.get('type') == 'ping':
+                    await self.ws.send('{"type":"pong"}')
+                    continue
+                data = message.get('data') or {}
+                version = (data.get('room') or {}).get('version')
+                if message.get('type') != 'state_update' or version is None:
+                    continue
+                async with self.changed:
+                    self.received.setdefault(version, time.perf_counter())
+                    if version > self.version:
+                        self.version = version
+                        self.state = data
+                    self.changed.notify_all()
+        except websockets.ConnectionClosed:
+            pass
+
+    async def wait_version(self, version: int) -> float:
+        async with self.changed:
+            await asyncio.wait_for(self.changed.wait_for(lambda: self.version >= version), WAIT_TIMEOUT)
+            return self.received.get(version, time.perf_counter())
+
+    async def close(self):
+        await self.ws.close()
+        await self.task
+
+
+async def timed(stats: Stats, name: str, call):
+    started = time.perf_counter()
+    try:
+        response = await call
+        response.raise_for_status()
+    except Exception:
+        stats.errors[name] += 1
+        raise
+    finally:
+        stats.latencies[name].append(time.perf_counter() - started)
+    return response, started
+
+
+async def broadcast(stats: Stats, readers: list, version: int, started: float):
+    """Ждём версию на всех сокетах комнаты и записываем задержку доставки."""
+    received = await asyncio.gather(*(r.wait_version(version) for r in readers))
+    stats.broadcast_lag.extend(t - started for t in received)
+
+
+async def play_room(client, ws_url: str, game_id: int, players: int, max_turns: int, stats: Stats, barrier):
+    readers = []
+    try:
+        response, _ = await timed(stats, 'create', client.post('/api/rooms/create', json={
+            'game_id': game_id, 'host_nickname': 'host'
+        }))
+        room = response.json()
+        code = room['room_code']
+        ids = [room['player_id']]
+        for i in range(players):
+            response, _ = await timed(stats, 'join', client.post('/api/rooms/join', json={
+                'room_code': code, 'nickname': f'p{i}'
+            }))
+            ids.append(response.json()['player_id'])
+
+        for _ in ids:
+            started = time.perf_counter()
+            ws = await websockets.connect(f'{ws_url}/ws/{code}', max_size=None)
+            stats.latencies['ws_connect'].append(time.perf_counter() - started)
+            readers.append(Reader(ws))
+
+        response, _ = await timed(stats, 'state', client.get(f'/api/rooms/{code}/state'))
+        version = response.json()['room']['version']
+    except BaseException:
+        # Иначе остальные комнаты и run_load навсегда зависнут на барьере
+        await barrier.abort()
+        for reader in readers:
+            await reader.close()
+        raise
+
+    try:
+        # Все комнаты начинают играть одновременно, чтобы мерить именно фазу ходов
+        await barrier.wait()
+
+        response, started = await timed(stats, 'start', client.post(f'/api/rooms/{code}/start', params={'player_id': ids[0]}))
+        version += 1
+        await broadcast(stats, readers, version, started)
+
+        turns = 0
+        while max_turns <= 0 or turns < max_turns:
+            state = readers[0].state
+            if state['room']['status'] != 'playing':
+                break
+            player_id = state['current_player']['id']
+            params = {'player_id': player_id}
+
+            response, started = await timed(stats, 'choice', client.post(
+                f'/api/rooms/{code}/choice', params=params, json={'choice': 'drink'}
+            ))
+            version += 1
+            await broadcast(stats, readers, version, started)
+
+            response, started = await timed(stats, 'next', client.post(f'/api/rooms/{code}/next', params=params))
+            version += 1
+            await broadcast(stats, readers, version, started)
+
+            turns += 1
+            stats.turns += 1
+
+        await timed(stats, 'leaderboard', client.get(f'/api/rooms/{code}/leaderboard'))
+    finally:
+        for reader in readers:
+            await reader.close()
+
+
+def seed_game(cards: int) -> int:
+    """Игра с cards карточками в той БД, что в DATABASE_URL; повторный запуск её переиспользует."""
+    from app import models
+    from app.database import init_db, run_db
+
+    def seed(db):
+        game = db.query(models.Game).filter(models.Game.name == LOAD_GAME_NAME).first()
+        if game is None:
+            game = models.Game(name=LOAD_GAME_NAME, description='scripts/load_test.py')
+            db.add(game)
+            db.flush()
+        have = db.query(models.Card).filter(models.Card.game_id == game.id).count()
+        for i in range(have, cards):
+            db.add(models.Card(game_id=game.id, image_path=f'load/{i}.png', drink_points=1, action_points=1))
+        db.commit()
+        return game.id
+
+    async def run():
+        await init_db()
+        return await run_db(seed)
+
+    return asyncio.run(run())
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args):
+        self.count += 1
+
+
+def start_server(port: int) -> tuple:
+    """uvicorn в фоновом потоке со своим event loop."""
+    import uvicorn
+    from sqlalchemy import event
+
+    from app import database
+
+    counter = QueryCounter()
+    engine = database.async_engine.sync_engine if database.IS_ASYNC else database.engine
+    event.listen(engine, 'before_cursor_execute', counter)
+
+    config = uvicorn.Config('app.main:app', host='127.0.0.1', port=port, log_level='warning', ws='websockets')
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started:
+        if not thread.is_alive() or time.monotonic() > deadline:
+            print("Сервер не запустился")
+            sys.exit(1)
+        time.sleep(0.05)
+    return server, thread, counter
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+async def run_load(args, base_url: str, game_id: int, counter) -> dict:
+    stats = Stats()
+    ws_url = base_url.replace('http', 'ws', 1)
+    barrier = asyncio.Barrier(args.rooms + 1)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=WAIT_TIMEOUT) as client:
+        rooms = [
+            asyncio.create_task(play_room(client, ws_url, game_id, args.players, args.turns, stats, barrier))
+            for _ in range(args.rooms)
+        ]
+        try:
+            await barrier.wait()
+        except asyncio.BrokenBarrierError:
+            pass  # Какая-то комната упала на подготовке; ошибки соберёт gather ниже
+        queries_before = counter.count if counter else None
+        started = time.perf_counter()
+        results = await asyncio.gather(*rooms, return_exceptions=True)
+        elapsed = time.perf_counter() - started
+        queries = counter.count - queries_before if counter else None
+
+    failed = [r for r in results if isinstance(r, BaseException)]
+    # Сначала настоящие причины, а не комнаты, которых разбудил сломанный барьер
+    for error in sorted(failed, key=lambda e: isinstance(e, asyncio.BrokenBarrierError))[:5]:
+        print(f"Комната упала: {error!r}")
+
+    return {
+        'rooms_failed': len(failed),
+        'turns': stats.turns,
+        'play_seconds': round(elapsed, 3),
+        'turns_per_s': round(stats.turns / elapsed, 2) if elapsed else 0,
+        # Все запросы фазы игры (start, choice, next, leaderboard), делённые на число ходов
+        'db_queries_per_turn': round(queries / stats.turns, 2) if queries is not None and stats.turns else None,
+        **stats.summary(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Нагрузочный тест комнат и WebSocket")
+    parser.add_argument('--rooms', type=int, default=20)
+    parser.add_argument('--players', type=int, default=4, help="Игроков в комнате, не считая ведущего")
+    parser.add_argument('--cards', type=int, default=20, help="Карточек в тестовой игре (длина партии)")
+    parser.add_argument('--turns', type=int, default=0, help="Ограничить число ходов в комнате (0 — до конца колоды)")
+    parser.add_argument('--connections', type=int, default=100, help="HTTP-соединений в пуле клиента")
+    parser.add_argument('--database-url', help="БД для встроенного сервера (по умолчанию временная SQLite)")
+    parser.add_argument('--url', help="Уже запущенный бэкенд, например http://localhost:8000 (нужен --game-id)")
+    parser.add_argument('--game-id', type=int, help="Игра для --url")
+    parser.add_argument('--output', type=Path, default=Path('load_test_results.json'))
+    args = parser.parse_args()
+
+    counter = None
+    server = None
+    if args.url:
+        if args.game_id is None:
+            print("С --url нужен --game-id")
+            sys.exit(1)
+        base_url = args.url.rstrip('/')
+        game_id = args.game_id
+    else:
+        tmp_dir = tempfile.mkdtemp(prefix='doorsip-load-')
+        os.environ['DATABASE_URL'] = args.database_url or f"sqlite:///{tmp_dir}/load.db"
+        os.environ.setdefault('CARDS_PATH', tmp_dir)
+        game_id = seed_game(args.cards)
+        port = free_port()
+        server, thread, counter = start_server(port)
+        base_url = f'http://127.0.0.1:{port}'
+
+    print(f"{args.rooms} комнат × {args.players} игроков против {base_url}")
+    try:
+        result = asyncio.run(run_load(args, base_url, game_id, counter))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            thread.join(10)
+
+    report = {
+        'config': {
+            'rooms': args.rooms,
+            'players': args.players,
+            'cards': args.cards,
+            'turns': args.turns,
+            'target': args.url or 'in-process',
+            'database': (args.url and 'external') or os.environ['DATABASE_URL'].split(':', 1)[0],
+            'room_engine': os.getenv('ROOM_ENGINE', 'db'),
+        },
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        **result,
+    }
+    args.output.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding='utf-8')
+
+    print("-" * 50)
+    for name, summary in report['endpoints'].items():
+        if summary['count']:
+            print(f"{name:<12} n={summary['count']:<6} p50 {summary['p50_ms']:8.2f}  p95 {summary['p95_ms']:8.2f}  "
+                  f"p99 {summary['p99_ms']:8.2f} мс  ошибок {summary['errors']}")
+    lag = report['broadcast_lag']
+    if lag['count']:
+        print(f"broadcast    p50 {lag['p50_ms']:.2f}  p95 {lag['p95_ms']:.2f}  p99 {lag['p99_ms']:.2f} мс")
+    print(f"Ходов: {report['turns']}, {report['turns_per_s']} ходов/с, запросов к БД на ход: {report['db_queries_per_turn']}")
+    print(f"Результат: {args.output}")
+    if report['rooms_failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()